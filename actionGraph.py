@@ -0,0 +1,165 @@
+import argparse
+import time
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from pymongo import ReplaceOne
+
+import scanMetrics
+import wfExtractor
+from wfModel import as_workflow
+
+# Dependency graph of a scan: repository -> workflow -> action or reusable
+# workflow at a ref. Every distinct node is judged once per TTL and stored in
+# ghast.action_nodes, the references in ghast.action_edges are indexed by
+# node name and ref so that the repositories depending on a node are one query
+
+
+class Node(NamedTuple):
+    # kind: action, workflow (reusable workflow) or docker
+    key: str
+    kind: str
+    name: str
+    ref: Optional[str]
+    repository: Optional[str]
+
+
+def parse_uses(uses) -> Optional[Node]:
+    # None for references inside the repository itself (./path)
+    if not isinstance(uses, str) or not uses or uses.startswith("./"):
+        return None
+    if uses.startswith("docker://"):
+        image = uses[len("docker://") :]
+        name, sep, ref = image.rpartition(":")
+        if not sep or "/" in ref:
+            # no tag, the colon was the one of a registry port
+            name, ref = image, ""
+        return Node(uses, "docker", name, ref or None, None)
+    name, _, ref = uses.partition("@")
+    kind = "workflow" if "/.github/workflows/" in name else "action"
+    repository = "/".join(name.split("/")[:2])
+    return Node(uses, kind, name, ref or None, repository)
+
+
+def references(wf) -> Iterable[Tuple[str, Node]]:
+    # (job id, node) of every job level and step level uses of a workflow
+    for job_id, job in as_workflow(wf).jobs.items():
+        node = parse_uses(job.uses)
+        if node is not None:
+            yield job_id, node
+        for step in job.steps:
+            node = parse_uses(step.uses)
+            if node is not None:
+                yield job_id, node
+
+
+def judge(node: Node) -> dict:
+    # Verdicts of a node, shared by every workflow referring to it
+    verdict = {"pinned": False, "up_to_date": None}
+    if node.kind == "docker" or node.ref is None:
+        return verdict
+    verdict["pinned"] = wfExtractor.is_pinned(node.key)
+    if node.kind == "workflow":
+        verdict["up_to_date"] = wfExtractor.check_reusable_version(node.key)
+    else:
+        verdict["up_to_date"] = wfExtractor.check_uses_version(node.key)
+    return verdict
+
+
+class GraphStore:
+    # Writes are buffered by record() and sent by flush(), along with the results
+    # of the scan; a node judged more than ttl ago is judged again, like the
+    # action index its verdicts come from expires
+    def __init__(self, nodes, edges, ttl=wfExtractor.ACTIONS_TTL):
+        self.nodes = nodes
+        self.edges = edges
+        self.ttl = ttl
+        # node key -> judged_at
+        self.stored = {}
+        self.indexed = False
+        self.pending_nodes = {}
+        # repo -> edge documents
+        self.pending_edges = {}
+
+    def index(self):
+        # Created on the first write, so that importing the scan stays offline
+        if not self.indexed:
+            self.edges.create_index([("name", 1), ("ref", 1)])
+            self.edges.create_index("repo")
+            self.edges.create_index("node")
+            self.indexed = True
+
+    def record(self, repo, wfID, workflows: List[Tuple[str, object]]):
+        # Replaces the references of a repository by those of its workflows
+        # [(file name, Workflow)], nodes are judged once per ttl
+        now = time.time()
+        edges = {}
+        for wf_file, wf in workflows:
+            for job_id, node in references(wf):
+                edges[(wf_file, job_id, node.key)] = node
+                judged = self.stored.get(node.key)
+                if judged is None or now - judged > self.ttl:
+                    self.pending_nodes[node.key] = ReplaceOne(
+                        {"_id": node.key},
+                        dict(
+                            node._asdict(), _id=node.key, judged_at=now, **judge(node)
+                        ),
+                        upsert=True,
+                    )
+                    self.stored[node.key] = now
+        self.pending_edges[repo] = [
+            {
+                "repo": repo,
+                "wfID": wfID,
+                "workflow": wf_file,
+                "job": job_id,
+                "node": key,
+                "kind": node.kind,
+                "name": node.name,
+                "ref": node.ref,
+            }
+            for (wf_file, job_id, key), node in edges.items()
+        ]
+
+    def flush(self):
+        if not self.pending_nodes and not self.pending_edges:
+            return
+        self.index()
+        with scanMetrics.timer("graph_write"):
+            if self.pending_nodes:
+                self.nodes.bulk_write(list(self.pending_nodes.values()), ordered=False)
+            if self.pending_edges:
+                self.edges.delete_many({"repo": {"$in": list(self.pending_edges)}})
+                edges = [edge for docs in self.pending_edges.values() for edge in docs]
+                if edges:
+                    self.edges.insert_many(edges, ordered=False)
+        self.pending_nodes = {}
+        self.pending_edges = {}
+
+    def affected(self, name, ref=None) -> List[str]:
+        # Repositories referring to the action or reusable workflow name, at ref
+        # or at any ref
+        query = {"name": name}
+        if ref is not None:
+            query["ref"] = ref
+        return sorted(self.edges.distinct("repo", query))
+
+    def dependencies(self, repo) -> List[dict]:
+        return list(self.edges.find({"repo": repo}, {"_id": 0}))
+
+
+if __name__ == "__main__":
+    from pymongo.mongo_client import MongoClient
+
+    parser = argparse.ArgumentParser(
+        description="Repositories depending on an action or reusable workflow"
+    )
+    parser.add_argument(
+        "--affected", dest="affected", required=True, help="e.g. actions/checkout"
+    )
+    parser.add_argument("--ref", dest="ref", help="Only this ref, e.g. v2")
+
+    args = parser.parse_args()
+    ghast = MongoClient("localhost")["ghast"]
+    store = GraphStore(ghast["action_nodes"], ghast["action_edges"])
+    for repo in store.affected(args.affected, args.ref):
+        print(repo)
@@ -0,0 +1,151 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import semantic_version
+
+import ghClient
+import scanMetrics
+
+log = logging.getLogger(__name__)
+
+# seconds before an action whose release could not be fetched is tried again
+FAILURE_TTL = 600
+
+
+class Entry(NamedTuple):
+    tag: Optional[str]
+    version: Optional[semantic_version.Version]
+    fetched_at: float
+
+
+def parse_version(tag):
+    try:
+        return semantic_version.Version.coerce(str(tag).replace("v", ""))
+    except:
+        return None
+
+
+class MongoStore:
+    # Compact documents {name, tag_name, fetched_at} in ghast.cache
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index("name")
+
+    def load(self):
+        for item in self.collection.find(
+            {}, {"_id": 0, "name": 1, "tag_name": 1, "fetched_at": 1}
+        ):
+            if "name" in item:
+                yield item["name"], item.get("tag_name"), item.get("fetched_at", 0)
+
+    def save(self, name, tag, fetched_at):
+        self.collection.replace_one(
+            {"name": name},
+            {"name": name, "tag_name": tag, "fetched_at": fetched_at},
+            upsert=True,
+        )
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS actions "
+            "(name TEXT PRIMARY KEY, tag_name TEXT, fetched_at REAL)"
+        )
+
+    def load(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name, tag_name, fetched_at FROM actions"
+            ).fetchall()
+        yield from rows
+
+    def save(self, name, tag, fetched_at):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO actions VALUES (?, ?, ?)",
+                (name, tag, fetched_at),
+            )
+
+
+class ActionIndex:
+    # action -> latest release tag, bulk loaded once and refreshed in background
+    # once older than ttl seconds
+    def __init__(self, store, ttl, failure_ttl=FAILURE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self.failure_ttl = min(failure_ttl, ttl)
+        self.entries = {}
+        self.pending = set()
+        self.refresh = queue.Queue()
+        self.lock = threading.Lock()
+        for name, tag, fetched_at in store.load():
+            self.entries[name] = Entry(tag, parse_version(tag), fetched_at or 0)
+        threading.Thread(target=self.refresher, daemon=True).start()
+
+    def __contains__(self, action):
+        return action in self.entries
+
+    def get(self, action) -> Entry:
+        entry = self.entries.get(action)
+        if entry is None:
+            scanMetrics.inc("cache_misses", tier="actions")
+            return self.fetch(action)
+        scanMetrics.inc("cache_hits", tier="actions")
+        if time.time() - entry.fetched_at > self.ttl:
+            scanMetrics.inc("cache_stale", tier="actions")
+            with self.lock:
+                if action not in self.pending:
+                    self.pending.add(action)
+                    self.refresh.put(action)
+        return entry
+
+    @scanMetrics.timed("action_fetch")
+    def fetch(self, action) -> Entry:
+        log.debug("Getting data for the action %s", action)
+        req = ghClient.get("/repos/" + action + "/releases/latest")
+        if req is not None and req.status_code == 200:
+            tag = json.loads(req.text).get("tag_name")
+        elif req is not None and req.status_code == 404:
+            # no release published, the version can not be judged
+            tag = None
+        else:
+            log.warning("No release data for %s: %s", action, req and req.status_code)
+            return self.failed(action)
+        return self.record(action, tag)
+
+    def failed(self, action) -> Entry:
+        # The previous tag, if any, is served and the action refreshed once it is
+        # failure_ttl seconds old, instead of fetched again by every step using
+        # it; kept out of the store, so a restart tries again
+        old = self.entries.get(action)
+        entry = Entry(
+            old and old.tag,
+            old and old.version,
+            time.time() - self.ttl + self.failure_ttl,
+        )
+        self.entries[action] = entry
+        return entry
+
+    def record(self, action, tag) -> Entry:
+        # Also used for releases resolved in bulk by repoResolver
+        entry = Entry(tag, parse_version(tag), time.time())
+        self.entries[action] = entry
+        self.store.save(action, tag, entry.fetched_at)
+        return entry
+
+    def refresher(self):
+        while True:
+            action = self.refresh.get()
+            try:
+                self.fetch(action)
+            finally:
+                with self.lock:
+                    self.pending.discard(action)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus
+import repoResolver
+import scanMetrics
+import wfExtractor
+import wrapper
+from bench_pipeline import offline
+from stubs import StubGitHub
+
+
+def scan(docs, batch, graphql, recorded, latency):
+    # Releases and tags resolved by REST calls only or by batched GraphQL
+    # queries first, with the same documents and the same stub responses
+    repoResolver.ENABLED = graphql
+    with StubGitHub(latency=latency, recorded=recorded) as stub:
+        offline(stub)
+        start = time.perf_counter()
+        results = {}
+        for doc in wrapper.prefetched(iter(docs), set(), batch):
+            results[doc["name"]] = wrapper.process_workflow(doc)[0]
+        elapsed = time.perf_counter() - start
+        requests = stub.requests
+    ghast = wfExtractor.mongo()["ghast"]
+    caches = {
+        "releases": {
+            d["name"]: d["tag_name"] for d in ghast["cache"].find({}, {"_id": 0})
+        },
+        "tags": {
+            d["repo"]: [t["commit"]["sha"] for t in d["tags"]]
+            for d in ghast["repo_cache"].find({}, {"_id": 0})
+        },
+    }
+    counters = scanMetrics.snapshot()["counters"]
+    return results, caches, {"seconds": elapsed, "api_requests": requests}, counters
+
+
+def unresolved(share, seed=0):
+    # Action repositories the GraphQL API reports as not found, REST still
+    # answers them; the batches resolve the repositories of the actions used,
+    # not the scanned ones
+    rng = random.Random(seed)
+    repositories = sorted(
+        {wfExtractor.reusable_repository(action) for action in corpus.actions}
+    )
+    failing = rng.sample(repositories, round(share * len(repositories)))
+    return {"graphql " + repo: None for repo in failing}
+
+
+def main(args):
+    docs = list(corpus.documents(args.count, args.seed, per_repo=args.per_repo))
+    recorded = unresolved(args.unresolved, args.seed)
+    rest = scan(docs, args.batch, False, recorded, args.latency)
+    batched = scan(docs, args.batch, True, recorded, args.latency)
+    same = rest[0] == batched[0] and rest[1] == batched[1]
+    report = {
+        "repositories": len(docs),
+        "rest": rest[2],
+        "graphql": batched[2],
+        "graphql_repositories": batched[3].get("graphql_repositories", []),
+        "same_results": same,
+    }
+    for mode in ("rest", "graphql"):
+        r = report[mode]
+        print(f"{mode:<8} {r['api_requests']:>6} API requests in {r['seconds']:.2f}s")
+    for item in report["graphql_repositories"]:
+        print(f"{item['labels']['outcome']:<8} {item['value']:>6g} repositories")
+    print("same results and caches" if same else "results or caches differ")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="API requests of a scan resolving releases and tags with REST "
+        "calls only and with batched GraphQL queries"
+    )
+    parser.add_argument(
+        "--count", dest="count", type=int, default=250, help="Number of repositories"
+    )
+    parser.add_argument("--per-repo", dest="per_repo", type=int, default=4)
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    parser.add_argument("--batch", dest="batch", type=int, default=100)
+    parser.add_argument(
+        "--latency",
+        dest="latency",
+        type=float,
+        default=0.0,
+        help="Seconds the stub GitHub API waits before every response",
+    )
+    parser.add_argument(
+        "--unresolved",
+        dest="unresolved",
+        type=float,
+        default=0.25,
+        help="Share of the action repositories the GraphQL queries fail on",
+    )
+    parser.add_argument("--json", dest="json", help="Also save the results here")
+
+    args = parser.parse_args()
+    logging.basicConfig(level="ERROR")
+    sys.exit(main(args))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import runMatcher
+import wfExtractor
+from runMatcher import critical_gh_context, critical_secrets
+
+filler = [
+    "make test",
+    "pip install -r requirements.txt",
+    "echo building $GITHUB_SHA",
+    'curl -sSL "https://example.com/install.sh" | bash',
+    "export PATH=$HOME/.local/bin:$PATH",
+]
+expressions = [
+    "echo ${{ github.event.issue.title }}",
+    'git commit -m "${{ github.event.pull_request.body }}"',
+    "echo ${{ github.sha }}",
+    "TOKEN=${{ secrets.NPM_TOKEN }} npm publish",
+    "echo ${{ github.actor }} ${{ secrets.GH_TOKEN }}",
+]
+
+
+def make_script(lines, ratio, rng):
+    return "\n".join(
+        rng.choice(expressions) if rng.random() < ratio else rng.choice(filler)
+        for _ in range(lines)
+    )
+
+
+def legacy(script):
+    # run_analyzer and the analyzer substring scans as they were before exprTaint
+    rex = r".*(\${{\s*github\.).*"
+    ret = []
+    for i, l in enumerate(script.split("\n")):
+        if re.match(rex, l):
+            ret.append(
+                (
+                    i,
+                    [c.name for c in critical_gh_context if c.value in l],
+                    [c.name for c in critical_secrets if c.value in l],
+                )
+            )
+    return ret
+
+
+def tainted(script):
+    # exprTaint.scan through run_analyzer, without a tainted scope
+    ret = []
+    for run in wfExtractor.run_analyzer({"run": script}, False, False):
+        names = {name for name, _ in run["matches"]}
+        ret.append(
+            (
+                run["position"],
+                [n for n in runMatcher.gh_context_names if n in names],
+                [n for n in runMatcher.secret_names if n in names],
+            )
+        )
+    return ret
+
+
+def timeit(fn, scripts, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for script in scripts:
+            fn(script)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    print(
+        f"{'lines':>7} {'ratio':>6} {'legacy ms':>10} {'exprTaint ms':>13} {'speedup':>8}"
+    )
+    for lines in args.lines:
+        for ratio in args.ratio:
+            scripts = [make_script(lines, ratio, rng) for _ in range(args.scripts)]
+            for script in scripts:
+                assert legacy(script) == tainted(script), "results differ"
+            old = timeit(legacy, scripts, args.repeat)
+            new = timeit(tainted, scripts, args.repeat)
+            print(
+                f"{lines:>7} {ratio:>6.2f} {old * 1000:>10.2f} {new * 1000:>13.2f} "
+                f"{old / new:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run block scanning: per-line regex and substring scans vs exprTaint"
+    )
+    parser.add_argument("--lines", type=int, nargs="+", default=[10, 1000, 20000])
+    parser.add_argument("--ratio", type=float, nargs="+", default=[0.0, 0.05, 0.5])
+    parser.add_argument("--scripts", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus
+import wfExtractor
+from bench_pipeline import offline
+from stubs import StubGitHub
+from wfModel import Workflow
+
+
+def retained(build):
+    # Bytes still allocated by the objects build() returns
+    gc.collect()
+    tracemalloc.start()
+    objects = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, len(objects)
+
+
+def main(args):
+    with StubGitHub() as stub:
+        offline(stub)
+        extracted = [
+            wfExtractor.extract_workflow(doc)
+            for _, doc in corpus.generate(args.count, args.seed, duplicates=0)
+        ]
+    # Both layouts are decoded from the same records, so every string is a
+    # fresh object as it is when parsed from YAML
+    records = [json.dumps(wf.to_dict()) for wf in extracted if wf is not None]
+    del extracted
+    dicts, count = retained(lambda: [json.loads(r) for r in records])
+    models, _ = retained(lambda: [Workflow.from_dict(json.loads(r)) for r in records])
+    report = {
+        "workflows": count,
+        "dict_bytes": dicts,
+        "model_bytes": models,
+        "dict_bytes_per_workflow": dicts / count,
+        "model_bytes_per_workflow": models / count,
+        "reduction": 1 - models / dicts,
+    }
+    print(f"{count} workflows held in memory")
+    print(f"{'layout':<8} {'MB':>9} {'KB/workflow':>12}")
+    print(f"{'dict':<8} {dicts / 2**20:>9.1f} {dicts / count / 1024:>12.2f}")
+    print(f"{'model':<8} {models / 2**20:>9.1f} {models / count / 1024:>12.2f}")
+    print(f"reduction {report['reduction']:.0%}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memory held by extracted workflows as plain dicts and as wfModel objects"
+    )
+    parser.add_argument("--count", dest="count", type=int, default=1000)
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    parser.add_argument("--json", dest="json", help="Also save the results here")
+
+    args = parser.parse_args()
+    logging.basicConfig(level="ERROR")
+    main(args)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from functools import wraps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import actionGraph
+import corpus
+import exprTaint
+import ghClient
+import scanMetrics
+import wfAnalyzer
+import wfExtractor
+import wrapper
+from stubs import MemoryClient, MemoryCollection, StubGitHub
+
+# (module, function) timed on every call; the timings of a stage include the
+# stages it calls, e.g. extract_workflow includes load_yaml and extract_steps
+stages = [
+    (wrapper, "process_workflow"),
+    (wfExtractor, "prefetch_actions"),
+    (wfExtractor, "extract_workflow"),
+    (wfExtractor, "load_yaml"),
+    (wfExtractor, "extract_steps"),
+    (wfExtractor, "run_analyzer"),
+    (wfExtractor, "check_uses_version"),
+    (wfExtractor, "pinned_up_to_date"),
+    (wfAnalyzer, "analyze_workflow"),
+]
+
+
+def timed(fn, samples):
+    @wraps(fn)
+    def inner(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    return inner
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+def offline(stub):
+    # Every Mongo collection and GitHub endpoint the pipeline touches is served
+    # from memory, the action index starts empty as on a first scan
+    ghClient.API_URL = stub.url
+    ghClient.pool = ghClient.TokenPool(["NO_TOKEN"])
+    ghClient.graphql_pool = ghClient.TokenPool(["NO_TOKEN"], "graphql")
+    wfExtractor._client = MemoryClient()
+    wfExtractor._index = None
+    wfExtractor._verdicts.clear()
+    exprTaint.clear()
+    wfExtractor.cached_tags.cache_clear()
+    scanMetrics.reset()
+    wrapper.results = MemoryCollection()
+    wrapper.quarantine = MemoryCollection()
+    wrapper.graph = actionGraph.GraphStore(MemoryCollection(), MemoryCollection())
+    wrapper.wf_cache = wrapper.WorkflowCache(
+        MemoryCollection(), wfExtractor.ACTIONS_TTL
+    )
+
+
+def run(args):
+    docs = list(
+        corpus.documents(
+            args.count,
+            args.seed,
+            per_repo=args.per_repo,
+            max_jobs=args.max_jobs,
+            max_steps=args.max_steps,
+            huge_run=args.huge_run,
+            duplicates=args.duplicates,
+        )
+    )
+    wfExtractor.set_yaml_engine(args.yaml_engine)
+    timings = {}
+    for module, name in stages:
+        timings[name] = []
+        setattr(module, name, timed(getattr(module, name), timings[name]))
+    if args.tracemalloc:
+        tracemalloc.start()
+    with StubGitHub(latency=args.latency) as stub:
+        offline(stub)
+        start = time.perf_counter()
+        with wrapper.result_writer(args.batch) as writer:
+            for doc in wrapper.prefetched(iter(docs), set(), args.batch):
+                writer.add(doc["_id"], wrapper.process_workflow(doc)[0])
+        elapsed = time.perf_counter() - start
+        requests = stub.requests
+    workflows = sum(len(doc["workflows"]) for doc in docs)
+    report = {
+        "engine": wfExtractor.yaml_engine,
+        "repositories": len(docs),
+        "workflows": workflows,
+        "seconds": elapsed,
+        "workflows_per_second": workflows / elapsed,
+        "api_requests": requests,
+        "rss_peak_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "stages": {
+            name: {
+                "calls": len(samples),
+                "total": sum(samples),
+                "p50": percentile(samples, 50),
+                "p90": percentile(samples, 90),
+                "p99": percentile(samples, 99),
+            }
+            for name, samples in timings.items()
+            if samples
+        },
+        "counters": scanMetrics.snapshot()["counters"],
+    }
+    if args.tracemalloc:
+        report["traced_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return report
+
+
+def main(args):
+    report = run(args)
+    print(
+        f"{report['workflows']} workflows of {report['repositories']} repositories "
+        f"in {report['seconds']:.2f}s with {report['engine']}: "
+        f"{report['workflows_per_second']:.1f} workflows/s, "
+        f"{report['api_requests']} API requests"
+    )
+    memory = f"peak RSS {report['rss_peak_kb'] / 1024:.1f} MB"
+    if "traced_peak_kb" in report:
+        memory += f", traced peak {report['traced_peak_kb'] / 1024:.1f} MB"
+    print(memory)
+    print(
+        f"{'stage':<20} {'calls':>8} {'total s':>9} "
+        f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}"
+    )
+    for name, s in report["stages"].items():
+        print(
+            f"{name:<20} {s['calls']:>8} {s['total']:>9.3f} {s['p50'] * 1000:>9.3f} "
+            f"{s['p90'] * 1000:>9.3f} {s['p99'] * 1000:>9.3f}"
+        )
+    for name, series in report["counters"].items():
+        for item in series:
+            labels = ",".join(f"{k}={v}" for k, v in item["labels"].items())
+            print(f"{name}{{{labels}}} {item['value']:g}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput, per stage latency and peak memory of the scan "
+        "pipeline on a synthetic corpus, with MongoDB and GitHub stubbed in memory"
+    )
+    parser.add_argument(
+        "--count", dest="count", type=int, default=250, help="Number of repositories"
+    )
+    parser.add_argument("--per-repo", dest="per_repo", type=int, default=4)
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    parser.add_argument("--max-jobs", dest="max_jobs", type=int, default=6)
+    parser.add_argument("--max-steps", dest="max_steps", type=int, default=15)
+    parser.add_argument(
+        "--huge-run",
+        dest="huge_run",
+        type=int,
+        default=5000,
+        help="Lines of the few huge run blocks",
+    )
+    parser.add_argument(
+        "--duplicates",
+        dest="duplicates",
+        type=float,
+        default=0.3,
+        help="Share of workflows repeating an earlier one",
+    )
+    parser.add_argument("--batch", dest="batch", type=int, default=100)
+    parser.add_argument(
+        "--latency",
+        dest="latency",
+        type=float,
+        default=0.0,
+        help="Seconds the stub GitHub API waits before every response",
+    )
+    parser.add_argument(
+        "--yaml-engine",
+        dest="yaml_engine",
+        choices=list(wfExtractor.yaml_engines),
+        default=wfExtractor.yaml_engine,
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        dest="tracemalloc",
+        action="store_true",
+        help="Also trace Python allocations (slows the run down)",
+    )
+    parser.add_argument(
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        help="Log the per workflow messages of the pipeline on stderr",
+    )
+    parser.add_argument("--json", dest="json", help="Also save the results here")
+
+    args = parser.parse_args()
+    logging.basicConfig(
+        level="DEBUG" if args.verbose else "ERROR", format=scanMetrics.LOG_FORMAT
+    )
+    main(args)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus
+import wfAnalyzer
+import wfExtractor
+from bench_pipeline import offline
+from stubs import StubGitHub
+
+
+def timed_outcomes(samples, planner):
+    start = time.perf_counter()
+    for repo, sample in samples:
+        wfAnalyzer.outcome(sample, repo, planner(sample))
+    return time.perf_counter() - start
+
+
+def main(args):
+    if args.src:
+        samples = list(wfExtractor.iter_workflows(args.src))
+    else:
+        samples = list(corpus.generate(args.count, args.seed))
+    with StubGitHub() as stub:
+        offline(stub)
+        # the first pass fills the action index and the tags cache for both
+        counts, mismatches = wfAnalyzer.verify_prefilter(samples)
+        full = timed_outcomes(samples, lambda sample: wfExtractor.FULL_PLAN)
+        filtered = timed_outcomes(samples, wfExtractor.classify)
+    report = {
+        "workflows": len(samples),
+        "plans": counts,
+        "mismatches": [repo for repo, _ in mismatches],
+        "full_seconds": full,
+        "prefiltered_seconds": filtered,
+        "speedup": full / filtered,
+    }
+    print(f"{len(samples)} workflows, plans {counts}")
+    print(f"full path   {full:8.3f}s")
+    print(f"prefiltered {filtered:8.3f}s ({report['speedup']:.2f}x)")
+    print(f"{len(mismatches)} mismatches")
+    for repo, plan in mismatches:
+        print(f"  {repo}: {plan}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Verify the raw text prefilter against the full path and time both"
+    )
+    parser.add_argument(
+        "--src",
+        dest="src",
+        help="workflow_tot.yml to use instead of the synthetic corpus",
+    )
+    parser.add_argument("--count", dest="count", type=int, default=1000)
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    parser.add_argument("--json", dest="json", help="Also save the results here")
+
+    args = parser.parse_args()
+    logging.basicConfig(level="ERROR")
+    sys.exit(main(args))
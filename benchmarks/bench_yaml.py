@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wfExtractor
+
+
+def read_corpus(src):
+    # A directory of workflow files or a workflow_tot.yml produced by run.sh
+    if os.path.isdir(src):
+        docs = []
+        for root, _, files in os.walk(src):
+            for name in sorted(files):
+                if name.endswith((".yml", ".yaml")):
+                    with open(os.path.join(root, name), errors="replace") as f:
+                        docs.append(f.read())
+        return docs
+    with open(src, encoding="utf-8", errors="replace") as f:
+        return [wf for wf in f.read().split("___WORKFLOW END___\n") if wf != ""]
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_engine(engine, src, repeat):
+    docs = read_corpus(src)
+    base = max_rss_kb()
+    fast = wfExtractor.yaml_engines[engine]
+    rejected = 0
+    for doc in docs:
+        try:
+            fast(doc)
+        except Exception:
+            rejected += 1
+    wfExtractor.set_yaml_engine(engine)
+    loaded = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        loaded = []
+        for doc in docs:
+            try:
+                loaded.append(wfExtractor.load_yaml(doc))
+            except Exception:
+                pass
+    elapsed = (time.perf_counter() - start) / repeat
+    return {
+        "engine": engine,
+        "documents": len(docs),
+        "rejected": rejected,
+        "seconds": elapsed,
+        "seconds_per_1000": elapsed * 1000 / max(len(docs), 1),
+        "rss_base_kb": base,
+        "rss_peak_kb": max_rss_kb(),
+    }
+
+
+def main(args):
+    if args.engine:
+        print(json.dumps(run_engine(args.engine, args.src, args.repeat)))
+        return
+    # Each engine runs in its own interpreter so that peak RSS is not shared
+    rows = []
+    for engine in wfExtractor.yaml_engines:
+        out = subprocess.run(
+            [sys.executable, __file__, "--src", args.src, "--engine", engine]
+            + ["--repeat", str(args.repeat)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(
+        f"{'engine':<12} {'docs':>7} {'rejected':>8} {'s/1000 docs':>12} "
+        f"{'peak RSS MB':>12} {'parse RSS MB':>13}"
+    )
+    for r in rows:
+        print(
+            f"{r['engine']:<12} {r['documents']:>7} {r['rejected']:>8} "
+            f"{r['seconds_per_1000']:>12.3f} {r['rss_peak_kb'] / 1024:>12.1f} "
+            f"{(r['rss_peak_kb'] - r['rss_base_kb']) / 1024:>13.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parse time and peak memory of the YAML engines of wfExtractor"
+    )
+    parser.add_argument(
+        "--src",
+        dest="src",
+        required=True,
+        help="workflow_tot.yml file or directory of workflow files",
+    )
+    parser.add_argument("--engine", dest="engine", help=argparse.SUPPRESS)
+    parser.add_argument("--repeat", dest="repeat", type=int, default=3)
+    parser.add_argument("--json", dest="json", help="Also save the results here")
+
+    args = parser.parse_args()
+    main(args)
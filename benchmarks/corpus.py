@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+import argparse
+import random
+
+# Deterministic synthetic workflows covering the shapes that matter to the hot
+# path: many jobs and steps, huge run blocks, many uses: references, anchors
+# and aliases, and exact duplicates as found across forks.
+
+actions = [
+    "actions/checkout",
+    "actions/setup-python",
+    "actions/setup-node",
+    "actions/cache",
+    "actions/upload-artifact",
+    "docker/build-push-action",
+    "github/codeql-action/init",
+    "peter-evans/create-pull-request",
+]
+events = [
+    "push",
+    "pull_request",
+    "pull_request_target",
+    "issue_comment",
+    "issues",
+    "schedule",
+]
+filler = [
+    "make test",
+    "pip install -r requirements.txt",
+    "python -m pytest -q",
+    "echo building $GITHUB_SHA",
+    'curl -sSL "https://example.com/install.sh" | bash',
+]
+expressions = [
+    'echo "${{ github.event.issue.title }}"',
+    'gh pr comment --body "${{ github.event.pull_request.body }}"',
+    "echo ${{ github.sha }}",
+    "npm publish --token ${{ secrets.NPM_TOKEN }}",
+    "echo ${{ github.actor }}",
+    'echo "${{ env.TITLE }}"',
+    'git tag "${{ steps.meta.outputs.title }}"',
+]
+
+
+def uses_ref(rng):
+    action = rng.choice(actions)
+    kind = rng.random()
+    if kind < 0.15:
+        return f"{action}@{rng.getrandbits(160):040x}"
+    if kind < 0.25:
+        return f"{action}@main"
+    return f"{action}@v{rng.randint(1, 4)}"
+
+
+def run_block(rng, lines, indent):
+    pad = " " * indent
+    body = [
+        rng.choice(expressions) if rng.random() < 0.05 else rng.choice(filler)
+        for _ in range(lines)
+    ]
+    return "|\n" + "\n".join(pad + line for line in body)
+
+
+def workflow(rng, index, max_jobs, max_steps, huge_run):
+    out = [f"name: Workflow {index}"]
+    triggers = rng.sample(events, rng.randint(1, 3))
+    shape = rng.random()
+    if shape < 0.2:
+        out.append(f"on: {triggers[0]}")
+    elif shape < 0.4:
+        out.append(f"'on': [{', '.join(triggers)}]")
+    else:
+        out.append("on:")
+        for event in triggers:
+            out.append(f"  {event}:")
+            out.append("    branches: [main]")
+    if rng.random() < 0.3:
+        out.append("permissions:\n  contents: read")
+    out.append("env: &common_env\n  CI: 'true'\n  LANG: C.UTF-8")
+    out.append("jobs:")
+    for j in range(rng.randint(1, max_jobs)):
+        out.append(f"  job{j}:")
+        out.append("    runs-on: ubuntu-latest")
+        if rng.random() < 0.3:
+            out.append("    if: github.event_name == 'push'")
+        if rng.random() < 0.4:
+            out.append("    permissions:\n      contents: read")
+        out.append("    env: *common_env")
+        out.append("    steps:")
+        if rng.random() < 0.2:
+            # untrusted data reaching later run blocks through env and outputs
+            out.append("      - id: meta")
+            out.append("        env:\n          TITLE: ${{ github.event.issue.title }}")
+            out.append('        run: echo "title=$TITLE" >> "$GITHUB_OUTPUT"')
+        for s in range(rng.randint(1, max_steps)):
+            if rng.random() < 0.5:
+                out.append(f"      - name: step {s}")
+                out.append(f"        uses: {uses_ref(rng)}")
+            else:
+                lines = huge_run if rng.random() < 0.02 else rng.randint(1, 12)
+                out.append(f"      - name: step {s}")
+                out.append(f"        run: {run_block(rng, lines, 10)}")
+    return "\n".join(out) + "\n"
+
+
+def not_a_workflow():
+    # Other YAML files picked up next to the workflows
+    return "version: 2\nupdates:\n  - package-ecosystem: pip\n    directory: /\n"
+
+
+def generate(count, seed=0, max_jobs=6, max_steps=15, huge_run=5000, duplicates=0.3):
+    # Yields (repository, yaml); a share of the documents repeats an earlier one
+    rng = random.Random(seed)
+    seen = []
+    for i in range(count):
+        if seen and rng.random() < duplicates:
+            doc = rng.choice(seen)
+        elif rng.random() < 0.02:
+            doc = not_a_workflow()
+        else:
+            doc = workflow(rng, i, max_jobs, max_steps, huge_run)
+            seen.append(doc)
+        yield f"org{i % 97}/repo{i}", doc
+
+
+def documents(count, seed=0, per_repo=4, **kwargs):
+    # Source documents shaped like the git-reactions workflows collection
+    batch = []
+    for n, (repo, doc) in enumerate(generate(count * per_repo, seed, **kwargs)):
+        batch.append({"name": f"ci{n % per_repo}.yml", "yaml": doc})
+        if len(batch) == per_repo:
+            yield {"_id": n // per_repo, "name": repo, "workflows": batch}
+            batch = []
+
+
+def write_tot(path, count, seed=0, **kwargs):
+    # Same layout as the workflow_tot.yml assembled by run.sh
+    with open(path, "w") as f:
+        for repo, doc in generate(count, seed, **kwargs):
+            f.write(f"# {repo}\n{doc}___WORKFLOW END___\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic workflow_tot.yml")
+    parser.add_argument("--dest", dest="dest", required=True)
+    parser.add_argument("--count", dest="count", type=int, default=1000)
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+
+    args = parser.parse_args()
+    write_tot(args.dest, args.count, args.seed)
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bson
+
+# In-memory stand-ins for the MongoDB collections and the GitHub APIs, so
+# that the pipeline can be measured offline and deterministically.
+
+# an aliased repository block of the queries built by repoResolver
+graphql_block_rex = re.compile(
+    r"(\w+): repository\(owner: \$(\w+), name: \$(\w+)\) \{([^}]*)\}"
+)
+
+
+def digest(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class StubGitHub:
+    # Responses are derived from the repository names, unless recorded gives
+    # them: {"GET <path>": [status, body]} for REST calls and
+    # {"graphql <owner/name>": repository node} for GraphQL aliases, a null node
+    # being reported as a NOT_FOUND error on its alias
+    def __init__(self, latency=0.0, remaining=5000, recorded=None):
+        self.latency = latency
+        self.remaining = remaining
+        self.recorded = recorded or {}
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are separate writes, Nagle would delay the body
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                code, body = stub.route(self.path)
+                self.reply(code, body)
+
+            def do_POST(self):
+                stub.requests += 1
+                size = int(self.headers.get("Content-Length", 0))
+                code, body = stub.post(self.path, self.rfile.read(size))
+                self.reply(code, body)
+
+            def reply(self, code, body):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("X-RateLimit-Remaining", str(stub.remaining))
+                self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def release(self, repo):
+        return f"v{int(digest(repo), 16) % 4 + 1}.0.0"
+
+    def tags(self, repo):
+        return [{"name": "v1.0.0", "commit": {"sha": digest(repo)}}]
+
+    def route(self, path):
+        if "GET " + path in self.recorded:
+            return tuple(self.recorded["GET " + path])
+        parts = path.strip("/").split("/")
+        if parts[0] == "rate_limit":
+            core = {"remaining": self.remaining, "reset": int(time.time()) + 3600}
+            return 200, {"resources": {"core": core}}
+        if parts[0] == "repos" and parts[-2:] == ["releases", "latest"]:
+            return 200, {"tag_name": self.release("/".join(parts[1:-2]))}
+        if parts[0] == "repos" and parts[-1] == "tags":
+            return 200, self.tags("/".join(parts[1:-1]))
+        return 404, {"message": "Not Found"}
+
+    def repository(self, repo, fields):
+        node = {}
+        if "...release" in fields:
+            node["latestRelease"] = {"tagName": self.release(repo)}
+        if "...tags" in fields:
+            refs = [
+                {
+                    "name": tag["name"],
+                    "target": {"__typename": "Commit", "oid": tag["commit"]["sha"]},
+                }
+                for tag in self.tags(repo)
+            ]
+            node["refs"] = {"nodes": refs}
+        return node
+
+    def post(self, path, body):
+        if path.rstrip("/") != "/graphql":
+            return 404, {"message": "Not Found"}
+        request = json.loads(body)
+        variables = request.get("variables", {})
+        data = {}
+        errors = []
+        for alias, owner, name, fields in graphql_block_rex.findall(request["query"]):
+            repo = f"{variables[owner]}/{variables[name]}"
+            node = self.recorded.get("graphql " + repo, self.repository(repo, fields))
+            if node is None:
+                errors.append(
+                    {
+                        "type": "NOT_FOUND",
+                        "path": [alias],
+                        "message": "Could not resolve to a Repository with the "
+                        f"name '{repo}'.",
+                    }
+                )
+            data[alias] = node
+        payload = {"data": data}
+        if errors:
+            payload["errors"] = errors
+        return 200, payload
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        value = doc.get(key)
+        if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte", "$ne") and value is None:
+                    return op == "$ne"
+                if op == "$gt" and not value > arg:
+                    return False
+                if op == "$gte" and not value >= arg:
+                    return False
+                if op == "$lt" and not value < arg:
+                    return False
+                if op == "$lte" and not value <= arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+
+class MemoryCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        self.docs = sorted(self.docs, key=lambda d: d.get(key), reverse=direction < 0)
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def close(self):
+        pass
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.docs = {}
+        self.ops = 0
+
+    def key(self, doc):
+        if "_id" not in doc:
+            doc["_id"] = len(self.docs)
+            while doc["_id"] in self.docs:
+                doc["_id"] += 1
+        return doc["_id"]
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.ops += 1
+        docs = [dict(d) for d in self.docs.values() if matches(d, query or {})]
+        if projection:
+            # nested fields keep their whole top level field
+            keep = {k.split(".")[0] for k, v in projection.items() if v}
+            if keep:
+                docs = [
+                    {k: v for k, v in d.items() if k in keep or k == "_id"}
+                    for d in docs
+                ]
+            if projection.get("_id") == 0:
+                for d in docs:
+                    d.pop("_id", None)
+        return MemoryCursor(docs)
+
+    def find_one(self, query=None, projection=None):
+        return next(iter(self.find(query, projection)), None)
+
+    def count_documents(self, query):
+        return len(list(self.find(query)))
+
+    def insert_one(self, doc):
+        self.ops += 1
+        # documents the driver could not encode are rejected like by pymongo
+        bson.encode(doc)
+        self.docs[self.key(doc)] = doc
+
+    def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.insert_one(doc)
+
+    def replace_one(self, query, doc, upsert=False):
+        self.ops += 1
+        old = self.find_one(query)
+        if old is not None:
+            doc = dict(doc, _id=old["_id"])
+        elif not upsert:
+            return
+        bson.encode(doc)
+        self.docs[self.key(doc)] = doc
+
+    def update_one(self, query, update, upsert=False):
+        self.ops += 1
+        old = self.find_one(query)
+        if old is None:
+            if not upsert:
+                return
+            old = {k: v for k, v in query.items() if not isinstance(v, dict)}
+        old.update(update.get("$set", {}))
+        self.docs[self.key(old)] = old
+
+    def delete_many(self, query):
+        self.ops += 1
+        for key in [k for k, d in self.docs.items() if matches(d, query)]:
+            del self.docs[key]
+
+    def bulk_write(self, requests, ordered=True):
+        self.ops += 1
+        for request in requests:
+            # InsertOne only carries a document, ReplaceOne a filter as well
+            if hasattr(request, "_filter"):
+                self.replace_one(request._filter, request._doc, request._upsert)
+            else:
+                self.insert_one(dict(request._doc))
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def distinct(self, key, query=None):
+        return list({d.get(key) for d in self.find(query or {})})
+
+
+class MemoryDatabase(dict):
+    def __missing__(self, name):
+        self[name] = MemoryCollection()
+        return self[name]
+
+
+class MemoryClient(dict):
+    def __missing__(self, name):
+        self[name] = MemoryDatabase()
+        return self[name]
@@ -0,0 +1,404 @@
+import os
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import sha256
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import scanMetrics
+from runMatcher import critical_gh_context, critical_secrets
+
+# Taint analysis of the ${{ }} expressions of a workflow. The untrusted github
+# contexts are followed through env (workflow, job and step level, and what a
+# script writes to $GITHUB_ENV), step outputs and job outputs into the run
+# blocks, where an expression is pasted in the script before the shell runs it.
+# Reading tainted env through the shell ($TITLE) is not reported: it is the
+# mitigation GitHub recommends, but it does taint what the script exports
+
+RUNS_CACHE_SIZE = int(os.getenv("GHAST_RUNS_CACHE", "65536"))
+
+# one token of an expression after optional blanks, the group matched is its kind
+token_rex = re.compile(
+    r"\s*(?:(\}\})|('(?:[^']|'')*')|(0x[0-9a-fA-F]+|\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)"
+    r"|([A-Za-z_][\w-]*)|(&&|\|\||[=!<>]=|[!<>()\[\].,*]))"
+)
+kinds = (None, "close", "string", "number", "ident", "op")
+# the opening of an expression, with its path when the whole expression is one
+# (${{ github.event.issue.title }}), the common case that needs no tokenizer
+open_rex = re.compile(
+    r"\$\{\{(?:[ \t]*([A-Za-z_][\w-]*(?:\.(?:[A-Za-z_][\w-]*|\*))*)[ \t]*\}\})?"
+)
+keywords = {"true", "false", "null"}
+
+# lines of a script exporting data to the next steps or to the step outputs
+export_markers = ("GITHUB_ENV", "GITHUB_OUTPUT", "::set-env", "::set-output")
+export_rex = re.compile(r"GITHUB_(ENV|OUTPUT)\b|::set-(env|output) name=([\w-]+)::")
+assign_rex = re.compile(r"([A-Za-z_][\w-]*)(=|<<)([\w-]*)")
+# $NAME, ${NAME}, $env:NAME (pwsh) and %NAME% (cmd)
+shell_rex = re.compile(r"\$\{?([A-Za-z_]\w*)|\$env:([A-Za-z_]\w*)|%([A-Za-z_]\w*)%")
+
+untrusted = tuple((tuple(c.value.split(".")), c.name) for c in critical_gh_context)
+SECRET = critical_secrets.SECRET_CDD.name
+# first segment of the paths a Scope can taint
+tracked = {"env", "steps", "needs"}
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    pos: int
+
+
+class StepTaint(NamedTuple):
+    # scan is only set for run steps
+    scope: "Scope"
+    run_hash: Optional[bytes] = None
+    scan: Optional["RunScan"] = None
+
+
+class RunScan(NamedTuple):
+    # hits: (line number, line, ((name, column), ...)) of the lines reading the
+    # github context or tainted data, name being a critical_gh_context or
+    # critical_secrets name. exports: ((kind, name), contexts) of the tainted
+    # data written to $GITHUB_ENV (kind env) or to the step outputs (outputs)
+    hits: Tuple
+    exports: Tuple
+
+
+def tokenize(text, pos=0) -> Tuple[List[Token], int]:
+    # Tokens of the expression starting at pos, right after its "${{", and the
+    # position following its "}}" (the end of text when it is not closed)
+    tokens = []
+    end = len(text)
+    while pos < end:
+        m = token_rex.match(text, pos)
+        if m is None:
+            # not part of the grammar, GitHub would reject the expression
+            pos += 1
+            continue
+        kind = kinds[m.lastindex]
+        if kind == "close":
+            return tokens, m.end()
+        tokens.append(Token(kind, m.group(m.lastindex), m.start(m.lastindex)))
+        pos = m.end()
+    return tokens, end
+
+
+def text_references(text) -> Iterable[Tuple[Tuple[str, ...], int]]:
+    # references() of every ${{ }} of text
+    m = open_rex.search(text)
+    while m is not None:
+        path = m.group(1)
+        if path is None:
+            tokens, end = tokenize(text, m.end())
+            yield from references(tokens)
+        else:
+            end = m.end()
+            path = tuple(path.lower().split("."))
+            if path[0] not in keywords:
+                yield path, m.start(1)
+        m = open_rex.search(text, end)
+
+
+def references(tokens) -> Iterable[Tuple[Tuple[str, ...], int]]:
+    # (path, position) of every context read by an expression. Contexts are
+    # case insensitive, the segments are lower cased; "*" stands for an index,
+    # a filter or a computed property, after which the path is cut
+    i, n = 0, len(tokens)
+    while i < n:
+        token = tokens[i]
+        i += 1
+        if token.kind != "ident" or token.text.lower() in keywords:
+            continue
+        if i < n and tokens[i].text == "(":
+            # a function call
+            continue
+        if i > 1 and tokens[i - 2].text == ".":
+            # the property of a path cut at a computed property
+            continue
+        path = [token.text.lower()]
+        while i + 1 < n:
+            op, name = tokens[i], tokens[i + 1]
+            if op.text == "." and (name.kind == "ident" or name.text == "*"):
+                path.append(name.text.lower())
+                i += 2
+            elif (
+                op.text == "["
+                and name.kind in ("string", "number")
+                and i + 2 < n
+                and tokens[i + 2].text == "]"
+            ):
+                if name.kind == "string":
+                    path.append(name.text[1:-1].replace("''", "'").lower())
+                else:
+                    path.append("*")
+                i += 3
+            elif op.text == "[":
+                path.append("*")
+                break
+            else:
+                break
+        yield tuple(path), token.pos
+
+
+def overlaps(path, pattern) -> bool:
+    # One is a prefix of the other: toJSON(github.event) reads every untrusted
+    # field of the event
+    return all(a == b or a == "*" or b == "*" for a, b in zip(path, pattern))
+
+
+@lru_cache(maxsize=4096)
+def untrusted_sources(path) -> Tuple[str, ...]:
+    return tuple(name for pattern, name in untrusted if overlaps(path, pattern))
+
+
+class Scope:
+    # Taint visible to a step: {path: names of the untrusted contexts flowing
+    # into it}, for env variables ("env", name), step outputs ("steps", id,
+    # "outputs"[, name]) and job outputs ("needs", job, "outputs", name)
+    __slots__ = ("tainted", "fingerprint")
+
+    def __init__(self, tainted=None):
+        self.tainted = tainted or {}
+        # the part of the memo key of a run block that is not its text
+        self.fingerprint = tuple(sorted(self.tainted.items()))
+
+    def sources(self, path) -> Tuple[str, ...]:
+        head = path[0]
+        if head == "github":
+            return untrusted_sources(path)
+        if head in tracked and self.tainted:
+            found = set()
+            for key, names in self.tainted.items():
+                if overlaps(path, key):
+                    found.update(names)
+            return tuple(sorted(found))
+        return ()
+
+    def update(self, changes) -> "Scope":
+        # changes: {path: names}, no names untaints the path (e.g. an env
+        # variable redefined with trusted data)
+        tainted = dict(self.tainted)
+        for key, names in changes.items():
+            if names:
+                tainted[key] = names
+            else:
+                tainted.pop(key, None)
+        if tainted == self.tainted:
+            return self
+        return Scope(tainted)
+
+
+EMPTY = Scope()
+
+
+def text_sources(text, scope) -> Tuple[str, ...]:
+    # Untrusted contexts flowing into a value of env, with or outputs
+    if not isinstance(text, str) or "${{" not in text:
+        return ()
+    found = set()
+    for path, _ in text_references(text):
+        found.update(scope.sources(path))
+    return tuple(sorted(found))
+
+
+def env_scope(scope, env) -> Scope:
+    # Scope of the code run under an env mapping, whose values are evaluated
+    # in the scope of the enclosing level
+    if not isinstance(env, dict) or not env:
+        return scope
+    changes = {("env", str(k).lower()): text_sources(v, scope) for k, v in env.items()}
+    return scope.update(changes)
+
+
+def scan(run, scope=EMPTY) -> RunScan:
+    lines = {}
+    tainted = {}
+    secrets = []
+    line, line_start, counted = 0, 0, 0
+    for path, pos in text_references(run):
+        # references come in order, newlines are only counted between them
+        newlines = run.count("\n", counted, pos)
+        if newlines:
+            line += newlines
+            line_start = run.rfind("\n", counted, pos) + 1
+        counted = pos
+        col = pos - line_start
+        if path[0] == "secrets":
+            secrets.append((line, (SECRET, col)))
+            continue
+        names = scope.sources(path)
+        if names:
+            tainted.setdefault(line, set()).update(names)
+        if names or path[0] == "github":
+            lines.setdefault(line, []).extend((name, col) for name in names)
+    # secrets are reported next to the contexts of a line, as they always were
+    for number, match in secrets:
+        if number in lines:
+            lines[number].append(match)
+    hits = ()
+    if lines:
+        text = run.split("\n")
+        hits = tuple(
+            (number, text[number], tuple(sorted(matches, key=lambda m: m[1])))
+            for number, matches in sorted(lines.items())
+        )
+    return RunScan(hits, exports(run, scope, tainted))
+
+
+def exports(run, scope, tainted) -> Tuple:
+    # Tainted data written to $GITHUB_ENV or to the outputs, one NAME=value or
+    # NAME<<DELIMITER heredoc at a time
+    if not any(marker in run for marker in export_markers):
+        return ()
+    shell = {
+        key[1]: names
+        for key, names in scope.tainted.items()
+        if key[0] == "env" and len(key) == 2
+    }
+    found = {}
+    heredoc = None
+    for number, text in enumerate(run.split("\n")):
+        names = set(tainted.get(number, ()))
+        if shell:
+            for m in shell_rex.finditer(text):
+                var = (m.group(1) or m.group(2) or m.group(3)).lower()
+                names.update(shell.get(var, ()))
+        if heredoc is not None:
+            key, delimiter, collected = heredoc
+            if delimiter.search(text):
+                if collected:
+                    found.setdefault(key, set()).update(collected)
+                heredoc = None
+            else:
+                collected.update(names)
+            continue
+        m = export_rex.search(text)
+        if m is None:
+            continue
+        if m.group(3):
+            key = (m.group(2).replace("output", "outputs"), m.group(3).lower())
+        else:
+            assign = assign_rex.search(text)
+            if assign is None:
+                continue
+            kind = "env" if m.group(1) == "ENV" else "outputs"
+            key = (kind, assign.group(1).lower())
+            if assign.group(2) == "<<" and assign.group(3):
+                delimiter = re.compile(
+                    rf"(?<![\w-]){re.escape(assign.group(3))}(?![\w-])"
+                )
+                heredoc = (key, delimiter, names)
+                continue
+        if names:
+            found.setdefault(key, set()).update(names)
+    return tuple(sorted((key, tuple(sorted(names))) for key, names in found.items()))
+
+
+# (run_hash, scope fingerprint) -> RunScan, least recently used first
+_runs = OrderedDict()
+_stats = {"hits": 0, "misses": 0}
+
+
+def scan_run(run, run_hash, scope=EMPTY) -> RunScan:
+    # Memoized: the same script under the same taint is scanned once, and
+    # identical scripts are the rule across the repositories of a scan
+    key = (run_hash, scope.fingerprint)
+    found = _runs.get(key)
+    if found is not None:
+        _runs.move_to_end(key)
+        _stats["hits"] += 1
+        return found
+    _stats["misses"] += 1
+    found = _runs[key] = scan(run, scope)
+    if len(_runs) > RUNS_CACHE_SIZE:
+        _runs.popitem(last=False)
+    return found
+
+
+@scanMetrics.collector
+def runs_tier():
+    return {
+        ("cache_hits", (("tier", "runs"),)): _stats["hits"],
+        ("cache_misses", (("tier", "runs"),)): _stats["misses"],
+    }
+
+
+def clear():
+    _runs.clear()
+    _stats.update(hits=0, misses=0)
+
+
+class Dataflow:
+    # Taint of the steps of a workflow, walked job by job on demand: a job is
+    # walked after the jobs it needs, whose outputs it can read
+    def __init__(self, workflow):
+        jobs = workflow.get("jobs")
+        self.jobs = jobs if isinstance(jobs, dict) else {}
+        self.env = env_scope(EMPTY, workflow.get("env"))
+        # job id -> ([StepTaint], {output: names})
+        self.walked = {}
+
+    def steps(self, job_id) -> List[StepTaint]:
+        return self.walk(job_id)[0]
+
+    def walk(self, job_id):
+        found = self.walked.get(job_id)
+        if found is None:
+            # a job needed in a cycle reads no outputs
+            self.walked[job_id] = ([], {})
+            found = self.walked[job_id] = self.job(self.jobs.get(job_id))
+        return found
+
+    def job(self, job) -> Tuple[List[StepTaint], Dict]:
+        if not isinstance(job, dict):
+            return [], {}
+        needs = job.get("needs") or ()
+        if isinstance(needs, str):
+            needs = [needs]
+        changes = {}
+        for need in needs if isinstance(needs, list) else ():
+            if not isinstance(need, str):
+                continue
+            for name, names in self.walk(need)[1].items():
+                changes[("needs", need.lower(), "outputs", name)] = names
+        scope = env_scope(self.env.update(changes), job.get("env"))
+        taint = []
+        steps = job.get("steps")
+        for step in steps if isinstance(steps, list) else ():
+            if not isinstance(step, dict):
+                taint.append(StepTaint(scope))
+                continue
+            step_scope = env_scope(scope, step.get("env"))
+            step_id = step.get("id")
+            outputs = ("steps", str(step_id).lower(), "outputs")
+            run = step.get("run")
+            if isinstance(run, str):
+                run_hash = sha256(run.encode()).digest()
+                found = scan_run(run, run_hash, step_scope)
+                taint.append(StepTaint(step_scope, run_hash, found))
+                changes = {}
+                for (kind, name), names in found.exports:
+                    if kind == "env":
+                        changes[("env", name)] = names
+                    elif step_id is not None:
+                        changes[outputs + (name,)] = names
+                scope = scope.update(changes)
+                continue
+            taint.append(StepTaint(step_scope))
+            inputs = step.get("with")
+            if step_id is not None and isinstance(inputs, dict):
+                # what an action outputs is assumed to carry what it was given
+                found = set()
+                for value in inputs.values():
+                    found.update(text_sources(value, step_scope))
+                if found:
+                    scope = scope.update({outputs: tuple(sorted(found))})
+        outputs = job.get("outputs")
+        found = {}
+        if isinstance(outputs, dict):
+            for name, value in outputs.items():
+                names = text_sources(value, scope)
+                if names:
+                    found[str(name).lower()] = names
+        return taint, found
@@ -0,0 +1,164 @@
+import logging
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+import scanMetrics
+
+# Point GHAST_API_URL to a local stub server to run without reaching GitHub
+API_URL = os.getenv("GHAST_API_URL", "https://api.github.com").rstrip("/")
+MAX_PARALLEL = int(os.getenv("GHAST_API_PARALLEL", "8"))
+MAX_RETRIES = int(os.getenv("GHAST_API_RETRIES", "5"))
+TIMEOUT = 30
+
+_session = None
+
+log = logging.getLogger(__name__)
+
+
+class TokenPool:
+    # Tracks the rate limit budget of every key from the X-RateLimit-* headers,
+    # resource is the budget they count against (REST "core" or "graphql")
+    def __init__(self, tokens, resource="core"):
+        self.tokens = tokens
+        self.resource = resource
+        self.remaining = {t: float("inf") for t in tokens}
+        self.reset = {t: 0 for t in tokens}
+        self.cond = threading.Condition()
+        self.stats = {"requests": 0, "forbidden": 0, "waited": 0.0}
+        self.per_token = {t: 0 for t in tokens}
+
+    def acquire(self) -> str:
+        # Picks the key with the most budget left, parks only if all are exhausted
+        with self.cond:
+            while True:
+                now = time.time()
+                for t in self.tokens:
+                    if self.remaining[t] <= 0 and self.reset[t] <= now:
+                        self.remaining[t] = float("inf")
+                best = max(self.tokens, key=lambda t: self.remaining[t])
+                if self.remaining[best] > 0:
+                    self.remaining[best] -= 1
+                    self.stats["requests"] += 1
+                    self.per_token[best] += 1
+                    # keys are only identified by their position in the pool
+                    scanMetrics.inc(
+                        "api_requests",
+                        token=self.tokens.index(best),
+                        resource=self.resource,
+                    )
+                    return best
+                delay = max(min(self.reset.values()) - now, 0) + 1
+                log.warning(
+                    "Github %s API limit reached on every key, waiting %.0fs",
+                    self.resource,
+                    delay,
+                )
+                self.stats["waited"] += delay
+                scanMetrics.inc("rate_limit_sleeps")
+                scanMetrics.inc("rate_limit_sleep_seconds", delay)
+                self.cond.wait(delay)
+
+    def update(self, token, res) -> bool:
+        # Returns True when the response was refused because of a rate limit
+        with self.cond:
+            remaining = res.headers.get("X-RateLimit-Remaining")
+            reset = res.headers.get("X-RateLimit-Reset")
+            if remaining is not None:
+                self.remaining[token] = int(remaining)
+            if reset is not None:
+                self.reset[token] = int(reset)
+            if res.status_code not in (403, 429):
+                return False
+            self.stats["forbidden"] += 1
+            scanMetrics.inc("api_forbidden", status=res.status_code)
+            retry_after = res.headers.get("Retry-After")
+            if retry_after is not None:
+                # secondary rate limit, the key is benched for the given time
+                self.remaining[token] = 0
+                self.reset[token] = time.time() + int(retry_after)
+                return True
+            return remaining == "0"
+
+    def status(self):
+        with self.cond:
+            known = [r for r in self.remaining.values() if r != float("inf")]
+            return sum(known) if known else -1, min(self.reset.values())
+
+
+pool = TokenPool(os.getenv("ght", "NO_TOKEN").split("|"))
+graphql_pool = TokenPool(pool.tokens, "graphql")
+
+
+def session() -> Session:
+    # One pooled session per process, connections are kept alive between calls
+    global _session
+    if _session is None:
+        _session = Session()
+        adapter = HTTPAdapter(pool_connections=MAX_PARALLEL, pool_maxsize=MAX_PARALLEL)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def headers(token: str):
+    if token == "NO_TOKEN":
+        return {}
+    return {"Authorization": f"token {token}"}
+
+
+def get(path: str):
+    return request("GET", path, pool)
+
+
+def graphql(query: str, variables: dict):
+    # GraphQL queries have their own rate limit budget, tracked in graphql_pool
+    return request(
+        "POST", "/graphql", graphql_pool, {"query": query, "variables": variables}
+    )
+
+
+def request(method: str, path: str, budget: TokenPool, body=None):
+    # Rate limited calls are retried once a key has budget again, server errors
+    # and connection failures up to MAX_RETRIES times with an exponential backoff
+    res = None
+    failures = 0
+    while failures < MAX_RETRIES:
+        token = budget.acquire()
+        try:
+            with scanMetrics.timer("api_request"):
+                res = session().request(
+                    method,
+                    API_URL + path,
+                    headers=headers(token),
+                    json=body,
+                    timeout=TIMEOUT,
+                )
+        except RequestException as e:
+            log.warning("Error requesting %s: %s", path, e)
+            scanMetrics.inc("api_errors", error=type(e).__name__)
+            res = None
+        else:
+            if budget.update(token, res):
+                continue
+            if res.status_code < 500:
+                return res
+            scanMetrics.inc("api_errors", error=res.status_code)
+        time.sleep(2**failures)
+        failures += 1
+    return res
+
+
+def stats():
+    return dict(pool.stats, per_token=list(pool.per_token.values()))
+
+
+def fetch_all(fn, items, parallel=MAX_PARALLEL):
+    # Bounded fan-out of blocking calls sharing the pooled session
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        return list(executor.map(fn, items))
@@ -0,0 +1,179 @@
+import json
+import os
+import sys
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional
+
+try:
+    from importlib.metadata import packages_distributions
+except ImportError:
+    packages_distributions = None
+
+# Classification of the modules imported by a scanned tree: builtin (compiled
+# into the interpreter), stdlib, local (found in the tree itself) or
+# third-party, the latter mapped to the distribution that provides it
+
+BUILTINS_LIST = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "python_builtins.txt"
+)
+# JSON table {module: distribution}, extended with the mapping of the installed
+# distributions the first time it is created
+DISTRIBUTIONS_TABLE = os.getenv("GHAST_DISTRIBUTIONS")
+
+BUILTIN = "builtin"
+STDLIB = "stdlib"
+LOCAL = "local"
+THIRD_PARTY = "third_party"
+
+# import names that differ from the name of their distribution on PyPI
+known_distributions = {
+    "attr": "attrs",
+    "bs4": "beautifulsoup4",
+    "Crypto": "pycryptodome",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "dotenv": "python-dotenv",
+    "git": "GitPython",
+    "jwt": "PyJWT",
+    "magic": "python-magic",
+    "MySQLdb": "mysqlclient",
+    "OpenSSL": "pyOpenSSL",
+    "PIL": "Pillow",
+    "serial": "pyserial",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "usb": "pyusb",
+    "yaml": "PyYAML",
+    "zmq": "pyzmq",
+}
+
+# top level names that distributions install by mistake (tests/ of a sdist,
+# src/ of a bad layout), never taken from the environment as a distribution
+generic_modules = frozenset(
+    {"doc", "docs", "example", "examples", "src", "test", "tests", "util", "utils"}
+)
+
+
+class Index(NamedTuple):
+    builtin: FrozenSet[str]
+    stdlib: FrozenSet[str]
+
+
+def prefixes(name: str):
+    # "a.b.c", "a.b", "a": a submodule is classified like its closest listed parent
+    parts = name.split(".")
+    for i in range(len(parts), 0, -1):
+        yield ".".join(parts[:i])
+
+
+@lru_cache(maxsize=None)
+def index() -> Index:
+    # Built once per process from the shipped list and the running interpreter,
+    # the list keeps the modules removed from recent Python versions
+    stdlib = set()
+    if os.path.exists(BUILTINS_LIST):
+        with open(BUILTINS_LIST) as f:
+            stdlib.update(line.strip() for line in f if line.strip())
+    stdlib.update(getattr(sys, "stdlib_module_names", ()))
+    builtin = frozenset(sys.builtin_module_names)
+    return Index(builtin, frozenset(stdlib | builtin))
+
+
+def local_roots(root: str) -> FrozenSet[str]:
+    # Top level names importable from the tree: the directories at its top
+    # (namespace packages need no __init__.py), then modules and packages
+    # sitting in a directory that is not itself a package, at any depth (src/
+    # layouts)
+    names = set()
+    for path, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        if path == root:
+            names.update(dirs)
+        if "__init__.py" in files and path != root:
+            parent = os.path.dirname(path)
+            if not os.path.exists(os.path.join(parent, "__init__.py")):
+                names.add(os.path.basename(path))
+            continue
+        names.update(f[:-3] for f in files if f.endswith(".py") and f != "__init__.py")
+    return frozenset(names)
+
+
+class Classifier:
+    # Classifies each distinct module name once; relative imports (leading dots)
+    # are always local
+    def __init__(self, local: Iterable[str] = (), distributions=None):
+        self.index = index()
+        self.local = frozenset(local)
+        self.distributions = distributions if distributions is not None else table()
+        self.seen = {}
+
+    def kind(self, name: str) -> str:
+        found = self.seen.get(name)
+        if found is None:
+            found = self.seen[name] = self.lookup(name)
+        return found
+
+    def lookup(self, name: str) -> str:
+        if not name or name.startswith("."):
+            return LOCAL
+        for prefix in prefixes(name):
+            if prefix in self.index.builtin:
+                return BUILTIN
+            if prefix in self.index.stdlib:
+                return STDLIB
+        if name.split(".")[0] in self.local:
+            return LOCAL
+        return THIRD_PARTY
+
+    def distribution(self, name: str) -> str:
+        top = name.split(".")[0]
+        for prefix in prefixes(name):
+            if prefix in self.distributions:
+                return self.distributions[prefix]
+        return top
+
+    def classify(self, names: Iterable[str]) -> Dict:
+        # {builtin: [...], stdlib: [...], local: [...], third_party: {name: distribution}}
+        out = {BUILTIN: set(), STDLIB: set(), LOCAL: set(), THIRD_PARTY: {}}
+        for name in names:
+            kind = self.kind(name)
+            if kind == THIRD_PARTY:
+                out[THIRD_PARTY][name] = self.distribution(name)
+            else:
+                out[kind].add(name)
+        return {k: v if k == THIRD_PARTY else sorted(v) for k, v in out.items()}
+
+
+def installed_distributions() -> Dict[str, str]:
+    # The first distribution providing each top level module of the environment
+    if packages_distributions is None:
+        return {}
+    return {
+        name: dists[0]
+        for name, dists in packages_distributions().items()
+        if dists and name not in generic_modules
+    }
+
+
+@lru_cache(maxsize=None)
+def load_table(path: Optional[str]) -> Dict[str, str]:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    mapping = dict(installed_distributions(), **known_distributions)
+    if path:
+        with open(path + ".tmp", "w") as f:
+            json.dump(mapping, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+    return mapping
+
+
+def table() -> Dict[str, str]:
+    return load_table(DISTRIBUTIONS_TABLE)
+
+
+def imported_names(stats) -> Iterable[str]:
+    # Module names of the stats collected by toolbelt's Analyzer
+    yield from stats.get("import", [])
+    yield from stats.get("from", {})
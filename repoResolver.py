@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import ghClient
+import scanMetrics
+
+# Latest releases and tags of many repositories per GitHub GraphQL query, each
+# repository is an aliased block; repositories the query could not resolve are
+# left to the REST endpoints
+BATCH = int(os.getenv("GHAST_GRAPHQL_BATCH", "50"))
+# Set to 0 to only use the REST endpoints
+ENABLED = os.getenv("GHAST_GRAPHQL", "1") != "0"
+# The first page of the REST tags endpoint
+TAGS_PAGE = 30
+
+fragments = {
+    "release": "fragment release on Repository { latestRelease { tagName } }",
+    "tags": (
+        'fragment tags on Repository { refs(refPrefix: "refs/tags/", '
+        f"first: {TAGS_PAGE}, orderBy: {{field: ALPHABETICAL, direction: DESC}}) "
+        "{ nodes { name target { __typename oid ... on Tag { target { oid } } } } } }"
+    ),
+}
+
+log = logging.getLogger(__name__)
+
+
+class Resolved(NamedTuple):
+    # release is None when the repository publishes none, tags are in the
+    # layout of the REST tags endpoint; a field that was not asked for is None
+    release: Optional[str]
+    tags: Optional[list]
+
+
+def can_batch(repo: str) -> bool:
+    # Only a well formed owner/repo can go in a query, anything else is left to
+    # the REST lookups
+    return repo.count("/") == 1 and all(repo.split("/"))
+
+
+def build_query(wanted) -> Tuple[str, dict]:
+    # wanted: [(repo, fragment names)], the owner and name go in variables
+    used = set()
+    params = []
+    blocks = []
+    variables = {}
+    for i, (repo, fields) in enumerate(wanted):
+        owner, name = repo.split("/")
+        variables[f"o{i}"], variables[f"n{i}"] = owner, name
+        params.append(f"$o{i}: String!, $n{i}: String!")
+        spreads = " ".join("..." + f for f in fields)
+        blocks.append(f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ {spreads} }}")
+        used.update(fields)
+    query = "\n".join(
+        [f"query({', '.join(params)}) {{"]
+        + blocks
+        + ["}"]
+        + [fragments[f] for f in sorted(used)]
+    )
+    return query, variables
+
+
+def rest_tags(refs) -> list:
+    tags = []
+    for ref in refs["nodes"]:
+        target = ref["target"]
+        # annotated tags point to a tag object, the commit is its target
+        if target["__typename"] == "Tag":
+            target = target["target"]
+        tags.append({"name": ref["name"], "commit": {"sha": target["oid"]}})
+    return tags
+
+
+def parse_repository(node, fields) -> Resolved:
+    release = tags = None
+    if "release" in fields:
+        latest = node.get("latestRelease")
+        release = latest and latest["tagName"]
+    if "tags" in fields:
+        tags = rest_tags(node["refs"])
+    return Resolved(release, tags)
+
+
+def query_batch(wanted) -> Dict[str, Resolved]:
+    global ENABLED
+    query, variables = build_query(wanted)
+    with scanMetrics.timer("graphql_batch"):
+        res = ghClient.graphql(query, variables)
+    if res is None or res.status_code != 200:
+        log.warning(
+            "GraphQL batch of %d repositories failed: %s",
+            len(wanted),
+            res and res.status_code,
+        )
+        if res is not None and res.status_code == 401:
+            # GraphQL needs a token, every later batch would fail the same way
+            log.warning("GraphQL disabled, resolving with the REST endpoints")
+            ENABLED = False
+        return {}
+    payload = json.loads(res.text)
+    data = payload.get("data") or {}
+    failed = {e["path"][0] for e in payload.get("errors", []) if e.get("path")}
+    resolved = {}
+    for i, (repo, fields) in enumerate(wanted):
+        node = data.get(f"r{i}")
+        if node is None or f"r{i}" in failed:
+            continue
+        try:
+            resolved[repo] = parse_repository(node, fields)
+        except (KeyError, TypeError) as e:
+            log.warning("Unexpected GraphQL data for %s: %s", repo, e)
+    return resolved
+
+
+def resolve(
+    releases: Iterable[str] = (), tags: Iterable[str] = ()
+) -> Dict[str, Resolved]:
+    # Repositories missing from the result have to be looked up with REST,
+    # whether they could not be batched or the query reported an error on them
+    wanted = {}
+    for repo in releases:
+        if can_batch(repo):
+            wanted.setdefault(repo, []).append("release")
+    for repo in tags:
+        if can_batch(repo):
+            wanted.setdefault(repo, []).append("tags")
+    if not ENABLED or not wanted:
+        return {}
+    items = sorted(wanted.items())
+    resolved = {}
+    batches = [items[i : i + BATCH] for i in range(0, len(items), BATCH)]
+    for batch, found in zip(batches, ghClient.fetch_all(query_batch, batches)):
+        scanMetrics.inc("graphql_repositories", len(found), outcome="resolved")
+        scanMetrics.inc(
+            "graphql_repositories", len(batch) - len(found), outcome="fallback"
+        )
+        resolved.update(found)
+    return resolved
@@ -0,0 +1,48 @@
+from enum import Enum
+
+
+class critical_gh_context(Enum):
+    ACTOR = "github.actor"
+    PULL_REQUEST_BODY = "github.event.pull_request.body"
+    PULL_REQUEST_TITLE = "github.event.pull_request.title"
+    ISSUE_TITLE = "github.event.issue.title"
+    ISSUE_BODY = "github.event.issue.body"
+    ISSUE_COMMENT_BODY = "github.event.issue_comment.body"
+    PULL_REQUEST_COMMENT_BODY = "github.event.pull_request_review_comment.body"
+    # branch names, commit messages and authors are chosen by whoever opens the
+    # pull request or pushes; * stands for any array index
+    HEAD_REF = "github.head_ref"
+    PULL_REQUEST_HEAD_REF = "github.event.pull_request.head.ref"
+    PULL_REQUEST_HEAD_LABEL = "github.event.pull_request.head.label"
+    PULL_REQUEST_HEAD_DEFAULT_BRANCH = (
+        "github.event.pull_request.head.repo.default_branch"
+    )
+    COMMENT_BODY = "github.event.comment.body"
+    REVIEW_BODY = "github.event.review.body"
+    DISCUSSION_TITLE = "github.event.discussion.title"
+    DISCUSSION_BODY = "github.event.discussion.body"
+    PAGE_NAME = "github.event.pages.*.page_name"
+    HEAD_COMMIT_MESSAGE = "github.event.head_commit.message"
+    HEAD_COMMIT_AUTHOR_EMAIL = "github.event.head_commit.author.email"
+    HEAD_COMMIT_AUTHOR_NAME = "github.event.head_commit.author.name"
+    COMMIT_MESSAGE = "github.event.commits.*.message"
+    COMMIT_AUTHOR_EMAIL = "github.event.commits.*.author.email"
+    COMMIT_AUTHOR_NAME = "github.event.commits.*.author.name"
+    WORKFLOW_RUN_HEAD_BRANCH = "github.event.workflow_run.head_branch"
+    WORKFLOW_RUN_HEAD_COMMIT_MESSAGE = "github.event.workflow_run.head_commit.message"
+    WORKFLOW_RUN_HEAD_COMMIT_AUTHOR_EMAIL = (
+        "github.event.workflow_run.head_commit.author.email"
+    )
+    WORKFLOW_RUN_HEAD_COMMIT_AUTHOR_NAME = (
+        "github.event.workflow_run.head_commit.author.name"
+    )
+
+
+class critical_secrets(Enum):
+    SECRET_CDD = "secrets."
+
+
+gh_context_names = [i.name for i in critical_gh_context]
+# position of a context in the enum, the order in which issues list them
+gh_context_rank = {name: i for i, name in enumerate(gh_context_names)}
+secret_names = [i.name for i in critical_secrets]
@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Process wide stage timers and counters. Recording is a couple of dict updates
+# under a lock, the snapshots are only built when exported.
+
+_lock = threading.Lock()
+# stage -> [calls, seconds, slowest call]
+_timers = {}
+# (name, ((label, value), ...)) -> value
+_counters = {}
+# [callable returning {(name, labels): running total}, totals at the last reset],
+# read at snapshot time
+_collectors = []
+
+LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(stage, seconds):
+    with _lock:
+        timer = _timers.get(stage)
+        if timer is None:
+            _timers[stage] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    def decorator(fn):
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+
+        return inner
+
+    return decorator
+
+
+def collector(fn):
+    _collectors.append([fn, {}])
+    return fn
+
+
+def reset():
+    # The sources of the collectors keep running, their totals are rebased
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        for item in _collectors:
+            item[1] = item[0]()
+
+
+def collected():
+    # Counts of the collectors since the last reset
+    counts = {}
+    with _lock:
+        collectors = [(fn, dict(base)) for fn, base in _collectors]
+    for fn, base in collectors:
+        for key, value in fn().items():
+            counts[key] = value - base.get(key, 0)
+    return counts
+
+
+def snapshot():
+    with _lock:
+        timers = {
+            stage: {"calls": t[0], "seconds": t[1], "max": t[2]}
+            for stage, t in _timers.items()
+        }
+        counters = dict(_counters)
+    # added, the counters may hold the collected counts merged from workers
+    for key, value in collected().items():
+        counters[key] = counters.get(key, 0) + value
+    grouped = {}
+    for (name, labels), value in sorted(counters.items()):
+        grouped.setdefault(name, []).append({"labels": dict(labels), "value": value})
+    return {"time": time.time(), "timers": timers, "counters": grouped}
+
+
+def merge(snap):
+    # Adds the snapshot of another process, e.g. a wrapper worker
+    for stage, t in snap["timers"].items():
+        with _lock:
+            timer = _timers.setdefault(stage, [0, 0.0, 0.0])
+            timer[0] += t["calls"]
+            timer[1] += t["seconds"]
+            timer[2] = max(timer[2], t["max"])
+    for name, series in snap["counters"].items():
+        for item in series:
+            inc(name, item["value"], **item["labels"])
+
+
+def prometheus(snap=None):
+    snap = snap or snapshot()
+    lines = ["# TYPE ghast_stage_seconds summary"]
+    for stage, t in sorted(snap["timers"].items()):
+        lines.append(f'ghast_stage_seconds_count{{stage="{stage}"}} {t["calls"]}')
+        lines.append(f'ghast_stage_seconds_sum{{stage="{stage}"}} {t["seconds"]}')
+    lines.append("# TYPE ghast_stage_seconds_max gauge")
+    for stage, t in sorted(snap["timers"].items()):
+        lines.append(f'ghast_stage_seconds_max{{stage="{stage}"}} {t["max"]}')
+    for name, series in sorted(snap["counters"].items()):
+        lines.append(f"# TYPE ghast_{name}_total counter")
+        for item in series:
+            labels = ",".join(f'{k}="{v}"' for k, v in item["labels"].items())
+            lines.append(f"ghast_{name}_total{{{labels}}} {item['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_json(path, snap=None):
+    # Replaced atomically, readers never see a partial snapshot
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snap or snapshot(), f, indent=2)
+    os.replace(tmp, path)
+
+
+class Exporter:
+    # Writes a JSON snapshot every `every` seconds and/or serves the Prometheus
+    # text format on http://host:port/metrics, a last snapshot is written on close
+    def __init__(self, path=None, port=None, every=30, host="127.0.0.1"):
+        self.path = path
+        self.every = every
+        self.stopped = threading.Event()
+        self.server = None
+        if port is not None:
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip("/") != "/metrics":
+                        self.send_error(404)
+                        return
+                    data = prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+                def log_message(self, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if path is not None:
+            threading.Thread(target=self.writer, daemon=True).start()
+
+    def writer(self):
+        while not self.stopped.wait(self.every):
+            write_json(self.path)
+
+    def close(self):
+        self.stopped.set()
+        if self.path is not None:
+            write_json(self.path)
+        if self.server is not None:
+            self.server.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--log-level",
+        dest="log_level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Per workflow and per request messages are logged at DEBUG",
+    )
+    parser.add_argument(
+        "--metrics", dest="metrics", help="JSON file the metrics snapshot is saved to"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        dest="metrics_port",
+        type=int,
+        help="Serve the metrics in the Prometheus text format on this port",
+    )
+    parser.add_argument(
+        "--metrics-every",
+        dest="metrics_every",
+        type=float,
+        default=30,
+        help="Seconds between two snapshots written to --metrics",
+    )
+
+
+def start(args):
+    # Logging goes to stderr so that stdout can carry records
+    logging.basicConfig(level=args.log_level, format=LOG_FORMAT)
+    return Exporter(args.metrics, args.metrics_port, args.metrics_every)
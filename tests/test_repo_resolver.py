@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+BENCHMARKS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"
+)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_graphql
+import corpus
+
+
+def outcomes(counters):
+    return {
+        item["labels"]["outcome"]: item["value"]
+        for item in counters.get("graphql_repositories", [])
+    }
+
+
+def corpus_repositories():
+    return {"/".join(action.split("/")[:2]) for action in corpus.actions}
+
+
+class GraphqlFallbackTest(unittest.TestCase):
+    # Both scans run against the stub GitHub API, the GraphQL one reporting the
+    # recorded repositories as not found
+
+    def setUp(self):
+        self.docs = list(corpus.documents(30, seed=1))
+
+    def scans(self, recorded):
+        rest = bench_graphql.scan(self.docs, 10, False, recorded, 0.0)
+        batched = bench_graphql.scan(self.docs, 10, True, recorded, 0.0)
+        return rest, batched
+
+    def test_failed_repositories_fall_back_to_rest(self):
+        recorded = {
+            "graphql actions/checkout": None,
+            "graphql github/codeql-action": None,
+        }
+        rest, batched = self.scans(recorded)
+        self.assertEqual(rest[0], batched[0])
+        self.assertEqual(rest[1], batched[1])
+        self.assertEqual(outcomes(batched[3]).get("fallback"), 2)
+        self.assertLess(batched[2]["api_requests"], rest[2]["api_requests"])
+
+    def test_every_repository_failing(self):
+        rest, batched = self.scans(bench_graphql.unresolved(1.0))
+        self.assertEqual(rest[0], batched[0])
+        self.assertEqual(rest[1], batched[1])
+        self.assertEqual(outcomes(batched[3]).get("resolved", 0), 0)
+
+    def test_fixture_names_action_repositories(self):
+        recorded = bench_graphql.unresolved(0.25)
+        self.assertEqual(len(recorded), 2)
+        for key in recorded:
+            self.assertIn(key[len("graphql ") :], corpus_repositories())
+
+
+if __name__ == "__main__":
+    unittest.main()
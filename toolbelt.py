@@ -7,24 +7,24 @@ import json
 import ast
 import argparse
 import glob
+import hashlib
 import os
+import re
+import sys
+from collections import Counter
+from multiprocessing import Pool
 
 from shlex import split as sh_split
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--code', dest='code',
-                    help='code to parse')
-parser.add_argument('--file', dest='file',
-                    help='code to parse')
-parser.add_argument('--struct', action='store_true',
-                    help='code to parse')
-parser.add_argument('--sec', dest='security',
-                    help='code to parse')
-parser.add_argument('--slscan', action='store_true')
-parser.add_argument('--analysis', dest="analysis")
-parser.add_argument('--imports', action='store_true')
+import importIndex
 
-args = parser.parse_args()
+# ijson is in requirements.txt, JsonStream reads the reports without it
+try:
+    import ijson
+    stream_errors = (ValueError, ijson.JSONError)
+except ImportError:
+    ijson = None
+    stream_errors = (ValueError,)
 
 
 def jsonifySWAs():
@@ -37,12 +37,18 @@ def jsonifySWAs():
         swa.append(json.loads(e))
 
 
-def parser_file(path: str):
+# Bump whenever the stats of a file change, cached stats are keyed on it
+TOOLBELT_VERSION = "2"
+
+
+def load_tree(path: str):
     with open(path) as source:
-        tree = ast.parse(source.read())
+        return ast.parse(source.read())
 
+
+def parser_file(path: str):
     analyzer = Analyzer()
-    analyzer.walk(tree)
+    analyzer.walk(load_tree(path))
     analyzer.report()
 
 
@@ -54,14 +60,248 @@ def parser(code: str):
     analyzer.report()
 
 def parse_imports(path: str):
-    with open(path) as source:
-        tree = ast.parse(source.read())
-
     analyzer = Analyzer()
-    analyzer.walk_imports(tree)
+    analyzer.walk_imports(load_tree(path))
     analyzer.report()
 
 
+def source_key(data: bytes):
+    return hashlib.sha256(TOOLBELT_VERSION.encode() + b"\n" + data).hexdigest()
+
+
+def scan_source(item):
+    # Imports and structure of one file in a single walk, run in the pool
+    path, data = item
+    try:
+        tree = ast.parse(data, filename=path)
+    except (SyntaxError, ValueError) as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    analyzer = Analyzer()
+    analyzer.walk(tree)
+    return {"stats": analyzer.stats}
+
+
+def python_files(root: str):
+    for path, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.endswith(".py"):
+                yield os.path.join(path, name)
+
+
+def load_cache(path: str):
+    cache = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                cache[entry.pop("key")] = entry
+    return cache
+
+
+def scan_dir(root: str, out, cache_path=None, workers=None, classify=False):
+    # Every .py file under root as one JSON line {path, key, cached, stats or
+    # error}; files whose content is in the cache are not parsed again. With
+    # classify, a last line {summary} sorts every module imported by the tree
+    cache = load_cache(cache_path)
+    keys = {}
+    pending = {}
+    for path in python_files(root):
+        with open(path, "rb") as f:
+            data = f.read()
+        keys[path] = source_key(data)
+        if keys[path] not in cache and keys[path] not in pending:
+            # copies of a file are parsed once
+            pending[keys[path]] = (path, data)
+    pending = list(pending.items())
+
+    if workers == 1 or len(pending) < 2:
+        scanned = map(scan_source, [item for _, item in pending])
+        pool = None
+    else:
+        pool = Pool(workers)
+        scanned = pool.imap(scan_source, [item for _, item in pending], chunksize=16)
+    fresh = {}
+    try:
+        for (key, _), result in zip(pending, scanned):
+            fresh[key] = result
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if cache_path and fresh:
+        with open(cache_path, "a") as f:
+            for key, result in fresh.items():
+                f.write(json.dumps(dict(result, key=key)) + "\n")
+    for path, key in keys.items():
+        result = fresh.get(key) or cache[key]
+        record = {"path": os.path.relpath(path, root), "key": key, "cached": key not in fresh}
+        record.update(result)
+        out.write(json.dumps(record) + "\n")
+    if classify:
+        classifier = importIndex.Classifier(importIndex.local_roots(root))
+        names = set()
+        for key in set(keys.values()):
+            names.update(importIndex.imported_names((fresh.get(key) or cache[key]).get("stats", {})))
+        out.write(json.dumps({"summary": classifier.classify(sorted(names))}) + "\n")
+    return len(keys), len(fresh)
+
+
+TAINT_REPORT = "taint-python-report.json"
+# Characters read at a time by JsonStream
+CHUNK_SIZE = 1 << 20
+
+blank_rex = re.compile(r"[ \t\n\r]*")
+# characters a JSON number can go on with
+number_rex = re.compile(r"[0-9.eE+-]*")
+
+
+class JsonStream:
+    # Sliding window over a JSON text read in chunks, each value is decoded as
+    # soon as it is complete and only the current one is kept in memory
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        data = self.f.read(self.chunk_size)
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        # next non blank character, None at the end of the text
+        while True:
+            self.pos = blank_rex.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return None
+
+    def expect(self, chars):
+        found = self.peek()
+        if found is None or found not in chars:
+            raise ValueError(f"Expected one of {chars!r}, found {found!r}")
+        self.pos += 1
+        return found
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # a number the window ends in may go on in the next chunk, even
+            # when cut after its dot or exponent (0. or 1e-)
+            if type(value) in (int, float) and not self.eof:
+                if number_rex.match(self.buf, end).end() == len(self.buf) and self.more():
+                    continue
+            self.pos = end
+            return value
+
+    def items(self, key):
+        # Items of the array under key in the top level object
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            name = self.value()
+            self.expect(":")
+            if name == key and self.peek() == "[":
+                self.expect("[")
+                if self.peek() == "]":
+                    self.expect("]")
+                else:
+                    while True:
+                        yield self.value()
+                        if self.expect(",]") == "]":
+                            break
+            else:
+                self.value()
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_vulnerabilities(path: str):
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "vulnerabilities.item")
+        return
+    with open(path, encoding="utf-8") as f:
+        yield from JsonStream(f).items("vulnerabilities")
+
+
+def vulnerable_file(vuln):
+    for side in ("sink", "source"):
+        if isinstance(vuln.get(side), dict) and vuln[side].get("path"):
+            return vuln[side]["path"]
+    return vuln.get("path") or vuln.get("filename")
+
+
+def summarize_report(path: str):
+    # Counts of one taint report, run in the pool
+    summary = {"vulnerabilities": 0, "by_cwe": Counter(), "by_severity": Counter(),
+               "by_file": Counter()}
+    try:
+        for vuln in iter_vulnerabilities(path):
+            summary["vulnerabilities"] += 1
+            summary["by_cwe"][str(vuln.get("cwe_category"))] += 1
+            summary["by_severity"][str(vuln.get("severity"))] += 1
+            summary["by_file"][str(vulnerable_file(vuln))] += 1
+    except stream_errors as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+    return summary
+
+
+def summarize_analysis(root: str, workers=None):
+    # Totals over the taint reports of every subdirectory of root, with the
+    # counts of each report under analyses
+    reports = sorted(
+        x for x in os.listdir(root)
+        if os.path.isdir(os.path.join(root, x)) and os.path.exists(os.path.join(root, x, TAINT_REPORT))
+    )
+    paths = [os.path.join(root, x, TAINT_REPORT) for x in reports]
+    if workers == 1 or len(paths) < 2:
+        summaries = list(map(summarize_report, paths))
+    else:
+        with Pool(workers) as pool:
+            summaries = pool.map(summarize_report, paths)
+    total = {"reports": len(paths), "vulnerabilities": 0, "by_cwe": Counter(),
+             "by_severity": Counter(), "by_file": Counter(), "analyses": {}}
+    for name, summary in zip(reports, summaries):
+        total["vulnerabilities"] += summary["vulnerabilities"]
+        for field in ("by_cwe", "by_severity", "by_file"):
+            total[field].update(summary[field])
+        total["analyses"][name] = summary
+    return total
+
+
+def merge_summary(summary, report_path: str, key="taint_summary"):
+    # Adds the summary to a <project>_report.json written by wfAnalyzer
+    report = {}
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+    report[key] = summary
+    with open(report_path + ".tmp", "w") as f:
+        json.dump(report, f)
+    os.replace(report_path + ".tmp", report_path)
+
+
+def from_module(node):
+    # relative imports keep their leading dots, "from . import x" is "."
+    return "." * node.level + (node.module or "")
+
+
 class Analyzer(ast.NodeVisitor):
     def __init__(self):
         self.stats = {"import": [], "from": {}, "if": [], "functionDef": [], "input": [], "open": [],
@@ -73,9 +313,9 @@ class Analyzer(ast.NodeVisitor):
                 for alias in node.names:
                     self.stats["import"].append(alias.name)
             elif isinstance(node, ast.ImportFrom):
-                self.stats["from"].update({node.module: []})
+                names = self.stats["from"].setdefault(from_module(node), [])
                 for alias in node.names:
-                    self.stats["from"][node.module].append(alias.name)
+                    names.append(alias.name)
 
     def walk(self, tree):
         for node in ast.walk(tree):
@@ -97,8 +337,9 @@ class Analyzer(ast.NodeVisitor):
                 for alias in node.names:
                     self.stats["import"].append(alias.name)
             elif isinstance(node, ast.ImportFrom):
+                names = self.stats["from"].setdefault(from_module(node), [])
                 for alias in node.names:
-                    self.stats["from"].append(alias.name)
+                    names.append(alias.name)
 
     def report(self):
         json_object = json.dumps(self.stats)
@@ -106,7 +347,36 @@ class Analyzer(ast.NodeVisitor):
 
 
 if __name__ == '__main__':
-    if args.file:
+    # Parsed here so that the pool workers can import the module
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--code', dest='code',
+                            help='code to parse')
+    arg_parser.add_argument('--file', dest='file',
+                            help='code to parse')
+    arg_parser.add_argument('--struct', action='store_true',
+                            help='code to parse')
+    arg_parser.add_argument('--sec', dest='security',
+                            help='code to parse')
+    arg_parser.add_argument('--slscan', action='store_true')
+    arg_parser.add_argument('--analysis', dest="analysis")
+    arg_parser.add_argument('--report', dest='report',
+                            help='<project>_report.json the --analysis summary is merged into')
+    arg_parser.add_argument('--imports', action='store_true')
+    arg_parser.add_argument('--dir', dest='dir',
+                            help='scan every .py file under this directory, one JSON line per file')
+    arg_parser.add_argument('--classify', action='store_true',
+                            help='end the --dir output with the imports sorted in builtin, stdlib, local and third-party')
+    arg_parser.add_argument('--cache', dest='cache',
+                            help='JSON lines cache of --dir, keyed by file content')
+    arg_parser.add_argument('--workers', dest='workers', type=int,
+                            help='processes used by --dir and --analysis')
+
+    args = arg_parser.parse_args()
+
+    if args.dir:
+        files, parsed = scan_dir(args.dir, sys.stdout, args.cache, args.workers, args.classify)
+        print(f"{files} files, {parsed} parsed", file=sys.stderr)
+    elif args.file:
         if args.struct:
             parser_file(args.file)
         elif args.imports:
@@ -129,9 +399,7 @@ if __name__ == '__main__':
         else:
             parser(args.code)
     elif args.analysis:
-        for x in os.listdir(f"{args.analysis}"):
-            if os.path.isdir(f"{args.analysis}/{x}") and os.path.exists(f"{args.analysis}/{x}/taint-python-report.json"):
-                taint = json.load(open(f"{args.analysis}/{x}/taint-python-report.json"))
-                for vuln in taint["vulnerabilities"]:
-                    print(vuln["cwe_category"], vuln["severity"])
-
+        summary = summarize_analysis(args.analysis, args.workers)
+        if args.report:
+            merge_summary(summary, args.report)
+        print(json.dumps(summary))
@@ -1,87 +1,225 @@
 import os
 import re
+import sys
 import ruamel.yaml as yaml
 from hashlib import sha256
 import time
 import json
 import argparse
+import logging
 import semantic_version
 import ruamel
-from requests import get
+
+try:
+    import yaml as pyyaml
+except ImportError:
+    pyyaml = None
+if getattr(pyyaml, "CSafeLoader", None) is None:
+    # without libyaml the engine would run the pure Python loader of PyYAML
+    # under its name, only the ruamel engines are offered then
+    pyyaml = None
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
 from pymongo.mongo_client import MongoClient
 
+import exprTaint
+import ghClient
+import repoResolver
+import runMatcher
+import scanMetrics
+import wfLimits
+import wfRecords
+from actionIndex import ActionIndex, MongoStore, SqliteStore
+from wfModel import Event, Job, Permissions, RunHit, Step, Workflow, event_rank
+
 # get position of string ": name:" in a file
-from typing import Dict, List
-
-keys = os.getenv("ght", "NO_TOKEN").split("|")
-
-event_rank = {
-    "fork": 3,
-    "issue_comment": 3,
-    "issues": 3,
-    "pull_request_comment": 3,
-    "watch": 3,
-    "pull_request": 2,
-    "pull_request_target": 2,
-    "pull_request_review": 1,
-    "pull_request_review_comment": 1,
-    "push": 1,
-    "release": 1,
-    "workflow_call": 1,
-    "workflow_dispatch": 1,
-    "workflow_run": 1,
-}
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+commit_rex = r"[0-9a-f]{40}"
+
+wf_end = "___WORKFLOW END___\n"
+
+uses_rex = re.compile(r"^[\s-]*uses:\s*(\S+)", re.MULTILINE)
+
+# Prefilter: indented content, lines starting at column 0 with content (matched
+# from the line break before them, a MULTILINE ^ is slow on long samples), top
+# level keys among them, and the double quoted escapes able to produce any
+# character or join lines
+content_rex = re.compile(r"^[ \t]*[^\s#]", re.MULTILINE)
+column0_rex = re.compile(r"\n([^\s#].*)")
+top_key_rex = re.compile(r"""(["']?)([A-Za-z_][\w-]*)\1[ \t]*:(?:[ \t]|$)""")
+escape_rex = re.compile(
+    r"\\(?:x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|\r?\n[ \t]*)"
+)
+
+TAGS_CACHE_SIZE = int(os.getenv("GHAST_TAGS_CACHE", "4096"))
+VERDICTS_CACHE_SIZE = int(os.getenv("GHAST_VERDICTS_CACHE", "65536"))
+ACTIONS_TTL = int(os.getenv("GHAST_ACTIONS_TTL", str(7 * 24 * 60 * 60)))
+# Path of a SQLite file holding the action index, ghast.cache is used otherwise
+ACTIONS_INDEX = os.getenv("GHAST_ACTIONS_INDEX")
+# Set to 0 to send every workflow through the full extraction and analysis
+PREFILTER = os.getenv("GHAST_PREFILTER", "1") != "0"
+
+_client = None
+_index = None
+# action@ref -> (index entry, verdict of check_uses_version), least recently
+# used first
+_verdicts = OrderedDict()
 
+log = logging.getLogger("wfExtractor")
 
-def get_key() -> str:
-    curr = keys.pop(0)
-    keys.append(curr)
-    return curr
+_ruamel_safe = yaml.YAML(typ="safe", pure=False)
+
+if pyyaml is not None:
+
+    class Yaml12Loader(pyyaml.CSafeLoader):
+        # GitHub reads workflows as YAML 1.2: "on", "yes", "off" are plain strings
+        yaml_implicit_resolvers = {
+            first: [r for r in resolvers if r[0] != "tag:yaml.org,2002:bool"]
+            for first, resolvers in pyyaml.SafeLoader.yaml_implicit_resolvers.items()
+        }
+
+    Yaml12Loader.add_implicit_resolver(
+        "tag:yaml.org,2002:bool",
+        re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"),
+        list("tTfF"),
+    )
+
+
+def mongo() -> MongoClient:
+    # Lazily opened so that forked workers never share the parent's connection
+    global _client
+    if _client is None:
+        _client = MongoClient()
+    return _client
+
+
+class TagsUnavailable(Exception):
+    pass
 
 
 def get_tags(repo):
-    print(f"Getting tags for {repo}")
-    with MongoClient() as client:
-        item = client["ghast"]["repo_cache"].find_one({"repo": repo})
-        if item:
-            return item["tags"]
-        api_url = "https://api.github.com/repos/" + repo + "/tags"
-        req = get(api_url, headers={"Authorization": f"token {get_key()}"})
-        if req.status_code == 200:
-            tags = json.loads(req.text)
-            entry = {"repo": repo, "tags": tags}
-            client["ghast"]["repo_cache"].insert_one(entry)
-        if req.status_code != 200:
-            print("Error getting tags", req.status_code, req.text)
-            await_limit()
-            return get_tags(repo)
+    # A failed lookup is not memoized, the next call tries again
+    try:
+        return cached_tags(repo)
+    except TagsUnavailable:
+        return []
+
+
+@lru_cache(maxsize=TAGS_CACHE_SIZE)
+def cached_tags(repo):
+    log.debug("Getting tags for %s", repo)
+    client = mongo()
+    item = client["ghast"]["repo_cache"].find_one({"repo": repo})
+    if item:
+        scanMetrics.inc("cache_hits", tier="tags_mongo")
+        return item["tags"]
+    scanMetrics.inc("cache_misses", tier="tags_mongo")
+    with scanMetrics.timer("tag_fetch"):
+        req = ghClient.get("/repos/" + repo + "/tags")
+    if req is not None and req.status_code == 404:
+        # the repository is gone, it has no tags to compare with
+        return []
+    if req is None or req.status_code != 200:
+        log.warning(
+            "Error getting tags of %s: %s %s",
+            repo,
+            req and req.status_code,
+            req and req.text,
+        )
+        raise TagsUnavailable(repo)
     tags = json.loads(req.text)
+    entry = {"repo": repo, "tags": tags}
+    client["ghast"]["repo_cache"].insert_one(entry)
     return tags
 
 
-def get_action_intel(action):
-    print(f"Getting data for the action {action}")
-    with MongoClient() as client:
-        res = client["ghast"]["cache"].find_one({"name": action})
-        if res:
-            return res
+@scanMetrics.collector
+def tags_memory_tier():
+    info = cached_tags.cache_info()
+    return {
+        ("cache_hits", (("tier", "tags_memory"),)): info.hits,
+        ("cache_misses", (("tier", "tags_memory"),)): info.misses,
+    }
+
+
+def is_pinned(action: str) -> bool:
+    return re.fullmatch(commit_rex, action.split("@")[-1]) is not None
+
+
+def pinned_up_to_date(action: str) -> bool:
+    # A commit is up to date when it is the one of the latest tag of the
+    # repository of the action
+    tags = get_tags(reusable_repository(action))
+    if not tags:
+        return False
+    return action.split("@")[-1] == tags[0].get("commit").get("sha")
+
+
+def action_index() -> ActionIndex:
+    global _index
+    if _index is None:
+        if ACTIONS_INDEX:
+            store = SqliteStore(ACTIONS_INDEX)
         else:
-            api_url = "https://api.github.com/repos/" + action + "/releases/latest"
+            store = MongoStore(mongo()["ghast"]["cache"])
+        _index = ActionIndex(store, ACTIONS_TTL)
+    return _index
 
-            req = get(
-                api_url,
-                headers={"Authorization": f"token {get_key()}"},
-            )
-            if req.status_code == 200:
-                res = json.loads(req.text)
-                res["name"] = action
-                client["ghast"]["cache"].insert_one(res)
-                return res
-            else:
-                print(f"Waiting for rate limit... {req.status_code}, {req.content}")
-                await_limit()
-                return get_action_intel(action)
+
+def get_action_intel(action):
+    entry = action_index().get(reusable_repository(action))
+    if entry.tag is None:
+        return None
+    return {"name": action, "tag_name": entry.tag}
+
+
+def get_uses_refs(sample: str) -> List[str]:
+    return [m.strip("'\"") for m in re.findall(uses_rex, sample)]
+
+
+def prefetch_actions(samples) -> int:
+    # Resolve releases/latest of every distinct action of a batch, and the tags
+    # of the repositories of the actions pinned at a commit, so that
+    # check_uses_version and pinned_up_to_date only hit the caches afterwards.
+    # Batched GraphQL queries are tried first, what they leave unresolved is
+    # fetched concurrently from the REST endpoints
+    actions = set()
+    repos = set()
+    for sample in samples:
+        for ref in get_uses_refs(sample):
+            if ref.startswith(("./", "docker://")) or "@" not in ref:
+                continue
+            if is_pinned(ref):
+                repos.add(reusable_repository(ref))
+            if ref.split("@")[-1].replace("v", "") in ["master", "main"]:
+                continue
+            # actions in a subdirectory and reusable workflows are judged on the
+            # releases of their repository
+            actions.add(reusable_repository(ref))
+    index = action_index()
+    missing = sorted(a for a in actions if a not in index)
+    repos = sorted(repos)
+    if repos:
+        cached = mongo()["ghast"]["repo_cache"].find(
+            {"repo": {"$in": repos}}, {"_id": 0, "repo": 1}
+        )
+        known = {item["repo"] for item in cached}
+        repos = [r for r in repos if r not in known]
+    with scanMetrics.timer("action_prefetch"):
+        resolved = repoResolver.resolve(missing, repos)
+        for action in missing:
+            if action in resolved:
+                index.record(action, resolved[action].release)
+        entries = [
+            {"repo": r, "tags": resolved[r].tags} for r in repos if r in resolved
+        ]
+        if entries:
+            mongo()["ghast"]["repo_cache"].insert_many(entries)
+        ghClient.fetch_all(index.get, [a for a in missing if a not in resolved])
+        ghClient.fetch_all(get_tags, [r for r in repos if r not in resolved])
+    return len(actions)
 
 
 def get_position(file_name, string):
@@ -95,153 +233,325 @@ def get_position(file_name, string):
 
 # Separate a string based on a patter similar to "#example\nname: example"
 def separate_string(string):
-    rex = r"___WORKFLOW END___\n"
-    found = re.findall(rex, string)
-    print(found)
-    indx = []
-    for e, i in enumerate(found):
-        indx.append(
-            (string.find(i), string.find(found[e + 1]) if e + 1 < len(found) else -1)
-        )
-    return indx
+    starts = [m.start() for m in re.finditer(wf_end, string)]
+    return [
+        (start, starts[e + 1] if e + 1 < len(starts) else -1)
+        for e, start in enumerate(starts)
+    ]
+
+
+def iter_workflows(path):
+    # Yields one (name, yaml) document at a time from a concatenation of
+    # workflows, only the document being read is kept in memory
+    chunk = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.endswith(wf_end):
+                chunk.append(line[: -len(wf_end)])
+                wf = "".join(chunk)
+                chunk = []
+                if wf != "":
+                    yield wf.split("\n")[0].replace("#", "").strip(), wf
+            else:
+                chunk.append(line)
+    wf = "".join(chunk)
+    if wf.strip() != "":
+        yield wf.split("\n")[0].replace("#", "").strip(), wf
 
 
-def extract_workflow(sample):
-    output = dict()
+def load_roundtrip(sample):
+    return yaml.round_trip_load(sample)
+
+
+def load_ruamel_safe(sample):
+    return _ruamel_safe.load(sample)
+
+
+def load_libyaml(sample):
+    return pyyaml.load(sample, Loader=Yaml12Loader)
+
+
+yaml_engines = {
+    "roundtrip": load_roundtrip,
+    "ruamel-safe": load_ruamel_safe,
+}
+if pyyaml is not None:
+    yaml_engines["libyaml"] = load_libyaml
+
+yaml_engine = os.getenv(
+    "GHAST_YAML_ENGINE", "libyaml" if pyyaml is not None else "ruamel-safe"
+)
+
+
+def set_yaml_engine(name: str):
+    global yaml_engine
+    if name not in yaml_engines:
+        raise ValueError(f"Unknown YAML engine {name}, use one of {list(yaml_engines)}")
+    yaml_engine = name
+
+
+@scanMetrics.timed("yaml_parse")
+def load_yaml(sample):
+    # The C backed loaders are tried first, documents they reject are parsed
+    # again with the pure Python round trip loader
+    if yaml_engine != "roundtrip":
+        try:
+            return yaml_engines[yaml_engine](sample)
+        except Exception as e:
+            scanMetrics.inc(
+                "yaml_fallbacks", engine=yaml_engine, error=type(e).__name__
+            )
+    return load_roundtrip(sample)
+
+
+class Plan(NamedTuple):
+    # kind is "full", "subset" (some rules can not report anything) or "fixed"
+    # (the verdict is known without parsing: not a workflow that can be analyzed)
+    kind: str
+    scan_runs: bool = True
+    check_uses: bool = True
+
+
+FULL_PLAN = Plan("full")
+FIXED_PLAN = Plan("fixed", False, False)
+
+
+def top_sections(sample) -> Optional[Dict[str, List[str]]]:
+    # Text of every entry of a block mapping laid out at column 0, None for any
+    # other layout (indented or flow mappings, directives, merge keys, ...)
+    sections = {}
+    text = "\n" + sample
+    key, start, head = None, 0, len(text)
+    for m in column0_rex.finditer(text):
+        line = m.group(1)
+        if key is None and line.rstrip() == "---":
+            continue
+        found = top_key_rex.match(line)
+        if found is None:
+            return None
+        if key is None:
+            head = m.start()
+        else:
+            sections.setdefault(key, []).append(text[start : m.start()])
+        key, start = found.group(2), m.start() + 1
+    # only comments and a document start may come before the first key
+    for m in content_rex.finditer(text, 0, head):
+        if m.end() - m.start() > 1:
+            return None
+    if key is not None:
+        sections.setdefault(key, []).append(text[start:])
+    return sections
+
+
+def expand_escapes(sample):
+    # Over-approximates the text of double quoted scalars everywhere: escapes
+    # are decoded and escaped line breaks joined, literal text is kept as is
+    def expand(m):
+        code = m.group()[2:]
+        return chr(int(code, 16)) if m.group()[1] in "xuU" else ""
+
+    return escape_rex.sub(expand, sample)
+
+
+def classify(sample) -> Plan:
+    # Cheap scans of the raw text ahead of the parse. A "fixed" plan is only
+    # returned when the full path is certain to drop the sample as well
+    if not PREFILTER:
+        return FULL_PLAN
+    sections = top_sections(sample)
+    if sections is not None:
+        on = sections.get("on")
+        if on is None:
+            scanMetrics.inc("prefilter", plan="fixed")
+            return FIXED_PLAN
+        if len(on) == 1:
+            try:
+                value = load_yaml(on[0])["on"]
+            except Exception:
+                pass
+            else:
+                try:
+                    extract_events(value)
+                except Exception:
+                    scanMetrics.inc("prefilter", plan="fixed")
+                    return FIXED_PLAN
+    text = expand_escapes(sample)
+    plan = Plan("subset", "${{" in text, "uses" in text)
+    if plan.scan_runs and plan.check_uses:
+        plan = FULL_PLAN
+    scanMetrics.inc("prefilter", plan=plan.kind)
+    return plan
+
+
+def extract_events(on) -> Tuple[Event, ...]:
+    if isinstance(on, str):
+        return (Event.parse(on),)
+    elif isinstance(on, list):
+        return tuple(Event.parse(event) for event in on)
+    elif isinstance(on, dict):
+        return tuple(
+            Event.parse(event, on[event] if isinstance(on[event], dict) else None)
+            for event in on
+        )
+    else:
+        assert False, f"Unsupported type {type(on)} for workflow.on field"
+
+
+def extract_workflow(sample, plan=None) -> Optional[Workflow]:
+    # None when the sample is not a workflow that can be analyzed, raises
+    # wfLimits.Quarantined when it is over one of the limits
+    wfLimits.check_document(sample)
+    if plan is None:
+        plan = classify(sample)
+    if plan.kind == "fixed":
+        return None
     try:
-        workflow = yaml.round_trip_load(sample)
-    except ruamel.yaml.scanner.ScannerError:
-        return output
-    except ruamel.yaml.composer.ComposerError:
-        return output
+        workflow = load_yaml(sample)
+    except ruamel.yaml.error.YAMLError as e:
+        scanMetrics.inc("parse_failures", stage="yaml", error=type(e).__name__)
+        return None
     if workflow is None:
-        return output
+        return None
+    wfLimits.check_aliases(sample, workflow)
 
     try:
-        output["name"] = workflow.get("name")
-
-        output["permissions"] = repr(workflow.get("permissions"))
-        output["conditional"] = workflow.get("if")
-
-        if isinstance(workflow["on"], str):
-            output["events"] = {
-                "type": workflow.get("on"),
-                "security_rank": event_rank[workflow.get("on")],
-            }
-        elif isinstance(workflow["on"], list):
-            output["events"] = [
-                {
-                    "type": workflow.get("on")[i],
-                    "security_rank": event_rank[workflow.get("on")[i]],
-                }
-                for i in range(len(workflow["on"]))
-            ]
-        elif isinstance(workflow["on"], dict):
-            output["events"] = []
-            for event in workflow.get("on"):
-                if isinstance(workflow.get("on")[event], dict):
-                    output["events"].append(
-                        {
-                            "type": event,
-                            "security_rank": event_rank[event],
-                            "filters": [k for k in workflow.get("on")[event].keys()],
-                        }
-                    )
-                else:
-                    output["events"].append(
-                        {"type": event, "security_rank": event_rank[event]}
-                    )
-        else:
-            assert (
-                False
-            ), f'Unsupported type {type(workflow.get("on"))} for workflow.on field'
+        on = workflow["on"]
+        events = extract_events(on)
 
         jobs = workflow.get("jobs", dict())
-        output["jobs"] = extract_jobs(jobs, True if workflow.get("if") else False)
-    except:
-        return output
-    return output
+        wfLimits.check_steps(sum(len(job.get("steps") or ()) for job in jobs.values()))
+        return Workflow(
+            workflow.get("name"),
+            Permissions.parse(workflow.get("permissions")),
+            workflow.get("if"),
+            events,
+            isinstance(on, str),
+            extract_jobs(
+                jobs,
+                True if workflow.get("if") else False,
+                plan.scan_runs,
+                exprTaint.Dataflow(workflow) if plan.scan_runs else None,
+            ),
+        )
+    except Exception as e:
+        scanMetrics.inc("parse_failures", stage="extract", error=type(e).__name__)
+        return None
 
 
-def extract_jobs(jobs, conditional_wf):
+def extract_jobs(jobs, conditional_wf, scan_runs=True, flow=None) -> Dict[str, Job]:
+    # flow: the exprTaint.Dataflow of the workflow, following untrusted data
+    # from job to job and step to step
     output = dict()
 
     for id, job in jobs.items():
-        output[id] = dict()
-
-        output[id]["name"] = job.get("name")
-        output[id]["uses"] = job.get("uses")
-        output[id]["conditional"] = job.get("if")
-        output[id]["permissions"] = job.get("permissions")
-        output[id]["steps"] = extract_steps(
-            job.get("steps", []), True if job.get("if") else False, conditional_wf
+        output[sys.intern(str(id))] = Job(
+            job.get("name"),
+            job.get("uses"),
+            job.get("if"),
+            Permissions.parse(job.get("permissions")),
+            extract_steps(
+                job.get("steps", []),
+                True if job.get("if") else False,
+                conditional_wf,
+                scan_runs,
+                flow.steps(id) if flow is not None else None,
+            ),
         )
 
     return output
 
 
-def extract_steps(steps, conditional_job, conditional_wf):
+@scanMetrics.timed("step_extraction")
+def extract_steps(
+    steps, conditional_job, conditional_wf, scan_runs=True, taint=None
+) -> Tuple[Step, ...]:
+    # taint: the exprTaint.StepTaint of every step, with the memoized scan of
+    # its run block
     output = []
 
     for i, step in enumerate(steps):
-        item = dict()
-
-        item["name"] = step.get("name")
-        item["conditional"] = step.get("if")
-        item["position"] = i + 1
-        item["uses"] = step.get("uses", None)
+        found = taint[i] if taint else None
+        item = Step(step.get("name"), step.get("if"), i + 1, step.get("uses", None))
         _run = step.get("run", None)
-        item["security"] = {}
-        if step.get("uses", None):
-            item["security"].update(
-                {"TP Actions Up-to-date": check_uses_version(item["uses"])}
-            )
-            # print(item['security'])
+        if item.uses:
+            item.up_to_date = check_uses_version(item.uses)
         if _run is not None:
-            item["run"] = len(_run.split("\n"))
-            item["run_hash"] = sha256(str.encode(_run)).hexdigest()
-            item["security"] = {
-                "runs": run_analyzer(step, conditional_wf, conditional_job)
-            }
-        else:
-            item["run"] = 0
+            # a run block replaces the version verdict in the reported security
+            item.up_to_date = None
+            item.lines = len(_run.split("\n"))
+            if found is not None and found.run_hash is not None:
+                item.run_hash = found.run_hash
+            else:
+                item.run_hash = sha256(str.encode(_run)).digest()
+            # without an expression in the raw text the scan can not find anything
+            hits = (
+                run_analyzer(
+                    step,
+                    conditional_wf,
+                    conditional_job,
+                    found.scan if found is not None else None,
+                )
+                if scan_runs
+                else []
+            )
+            item.runs = tuple(
+                RunHit(
+                    hit["position"],
+                    hit["line"],
+                    hit["conditional"],
+                    tuple(tuple(m) for m in hit["matches"]),
+                )
+                for hit in hits
+            )
         output.append(item)
 
-    return output
+    return tuple(output)
 
 
 def perms_analyzer(wf):
     wf_name, wf_dict = wf
     if wf_dict["permissions"]:
-        print(f"Workflow has permissions: {wf_dict['permissions']}")
+        log.info("Workflow has permissions: %s", wf_dict["permissions"])
     for job in wf_dict["jobs"].keys():
         if wf_dict["jobs"][job]["permissions"]:
-            print(f"Job {job} has permissions: {wf_dict['jobs'][job]['permissions']}")
+            log.info(
+                "Job %s has permissions: %s", job, wf_dict["jobs"][job]["permissions"]
+            )
 
 
 def run_analyzer(
-    step: Dict[str, any], cond_wf: bool, cond_job: bool
+    step: Dict[str, any], cond_wf: bool, cond_job: bool, scan=None
 ) -> List[Dict[str, any]]:
-    rex = r".*(\${{\s*github\.).*"
+    # Lines of the run block reading the github context or untrusted data. scan
+    # is the exprTaint.RunScan of the block under the taint of its step, the
+    # block is scanned without any tainted env or output otherwise
     ret = []
     if step["run"]:
-        for i, l in enumerate(step["run"].split("\n")):
-            if re.match(rex, l):
-                if step.get("if", None) or cond_wf or cond_job:
-                    ret.append({"position": i, "line": l, "conditional": True})
-                    # print(f"Conditional direct run at job {job} @ step {step['name']}")
-                else:
-                    ret.append({"position": i, "line": l, "conditional": False})
-                    # print(f"Direct run at job {job} @ step {step['name']}")
+        conditional = bool(step.get("if", None) or cond_wf or cond_job)
+        if scan is None:
+            scan = exprTaint.scan(step["run"])
+        for position, line, matches in scan.hits:
+            ret.append(
+                {
+                    "position": position,
+                    "line": line,
+                    "conditional": conditional,
+                    "matches": [list(m) for m in matches],
+                }
+            )
     return ret
 
 
 def secret_analyzer(job: str, step: Dict[str, any]):
-    secret_re = r".*(secrets\.).*"
     if step["run"]:
-        for l in step["run"]:
-            if re.match(secret_re, l):
-                print(f"Secret appears at job {job} @ step {step['name']}")
+        for number, line in enumerate(step["run"].split("\n")):
+            if runMatcher.critical_secrets.SECRET_CDD.value in line:
+                log.info(
+                    "Secret appears at job %s @ step %s, line %s",
+                    job,
+                    step["name"],
+                    number,
+                )
 
 
 def workflow_analyzer(wf):
@@ -249,70 +559,150 @@ def workflow_analyzer(wf):
     for job in wf_dict["jobs"].keys():
         for step in wf_dict["jobs"][job]["steps"]:
             run_analyzer(
-                job, step, wf_dict["conditional"], wf_dict["jobs"][job]["conditional"]
+                step, wf_dict["conditional"], wf_dict["jobs"][job]["conditional"]
             )
             secret_analyzer(job, step)
 
 
-def check_uses_version(action: str) -> bool:
+@scanMetrics.timed("version_check")
+def check_uses_version(action: str) -> Optional[bool]:
+    # local actions and docker images have no release to compare with
+    if action.startswith(("./", "docker://")):
+        return None
     if action.split("@")[-1].replace("v", "") in ["master", "main"]:
         return True
+    latest = action_index().get(reusable_repository(action))
+    # every action@ref is judged once per index entry, a refreshed entry is a
+    # new object and judged again
+    judged = _verdicts.get(action)
+    if judged is not None and judged[0] is latest:
+        _verdicts.move_to_end(action)
+        scanMetrics.inc("cache_hits", tier="verdicts")
+        return judged[1]
+    scanMetrics.inc("cache_misses", tier="verdicts")
+    verdict = judge_version(action, latest)
+    # replacing the verdict of a refreshed entry lets the old entry go
+    _verdicts[action] = (latest, verdict)
+    _verdicts.move_to_end(action)
+    if len(_verdicts) > VERDICTS_CACHE_SIZE:
+        _verdicts.popitem(last=False)
+    return verdict
+
+
+def judge_version(action: str, latest) -> Optional[bool]:
     try:
         version = semantic_version.Version.coerce(
             action.split("@")[-1].replace("v", "")
         )
     except:
         version = action.split("@")[-1].replace("v", "")
-    position = action.split("@")[0]
-    data = get_action_intel(position)
-    latest_version = str(data["tag_name"]).replace("v", "")
+    if latest.tag is None:
+        return None
+    if latest.version is None:
+        return str(latest.tag).replace("v", "") == version
     try:
-        latest_version = semantic_version.Version.coerce(latest_version)
-        if latest_version.major == version.major:
+        if latest.version.major == version.major:
             return True
         else:
-            return version >= latest_version
+            return version >= latest.version
     except:
-        return latest_version == version
+        return latest.version == version
+
+
+def reusable_repository(uses: str) -> str:
+    # owner/repo/path@ref, an action in a subdirectory or a reusable workflow,
+    # is released and tagged with owner/repo
+    return "/".join(uses.split("@")[0].split("/")[:2])
+
+
+def check_reusable_version(uses: str) -> Optional[bool]:
+    # A reusable workflow is judged against the releases of its repository
+    if "@" not in uses:
+        return None
+    return check_uses_version(reusable_repository(uses) + "@" + uses.split("@")[-1])
 
 
 def get_status():
-    api_url = "https://api.github.com/rate_limit"
-    req = get(api_url, headers={"Authorization": "token f{TOKEN}"})
-    try:
-        return req.json().get("resources", {}).get("core", {}).get(
-            "remaining", 0
-        ), req.json().get("resources", {}).get("core", {}).get("reset", 60 * 60)
-    except:
-        return 0, 60 * 60
-
-
-def await_limit():
-    limit, until = get_status()
-    if limit < 0:
-        time.sleep(until - int(datetime.utcnow().timestamp()) + 10)
-
-
-# if __name__ == "__main__":
-#     wfs = []
-#     print("Starting workflow analysis...")
-#     with open(args.workflowfile, encoding='utf-8', errors="replace") as f:
-#         dat = f.read()
-#         for wf in dat.split("___WORKFLOW END___\n"):
-#             # print(wf + "---------------------\n")
-#             if wf != "":
-#                 wf_name = wf.split("\n")[0].replace("#", "")
-#                 if wf.find(u'\x04') > 0:
-#                     print(wf[wf.find(u'\x04'):])
-#                 wfs.append((wf_name, extract_workflow(wf)))
-#                 print('\r' + str(len(wfs)))
-#     wfs_dict = dict()
-#     for w in wfs:
-#         if 'jobs' not in w[1].keys():
-#             continue
-#         if w[0] not in wfs_dict.keys():
-#             wfs_dict.update({w[0]: []})
-#         wfs_dict[w[0]].append(w[1])
-#     print(wfs_dict.keys())
-#     with open(args.destination+"/savedDictWfs.dat", "wb") as f:
-#         pickle.dump(wfs_dict, f)
+    return ghClient.pool.status()
+
+
+def extract_file(path, dest, batch=100, fmt="jsonl", stream=None):
+    # Records are appended as soon as a batch is extracted, so memory is bounded
+    # by the batch and not by the corpus; dest "-" streams them to stdout
+    count = 0
+    if dest == "-":
+        writer = wfRecords.RecordWriter(dest, fmt, stream or sys.stdout.buffer)
+    else:
+        writer = wfRecords.RecordWriter(
+            os.path.join(dest, "savedWfs" + wfRecords.formats[fmt]), fmt
+        )
+    with writer:
+        pending = []
+        for item in iter_workflows(path):
+            pending.append(item)
+            if len(pending) >= batch:
+                count += write_batch(writer, pending)
+                pending = []
+        count += write_batch(writer, pending)
+    log.info("%d workflows extracted to %s", count, writer.path)
+    return count
+
+
+def write_batch(writer, pending):
+    prefetch_actions(wf for _, wf in pending)
+    count = 0
+    for wf_name, wf in pending:
+        if wf.find("\x04") > 0:
+            log.debug("Control characters in %s: %r", wf_name, wf[wf.find("\x04") :])
+        try:
+            with wfLimits.deadline(wfLimits.DOC_SECONDS):
+                extracted = extract_workflow(wf)
+        except wfLimits.Quarantined as e:
+            log.warning("Quarantined %s: %s", wf_name, e)
+            wfLimits.record(mongo()["ghast"]["quarantine"], e, repo=wf_name)
+            continue
+        if extracted is None:
+            continue
+        writer.write(wf_name, extracted.to_dict())
+        count += 1
+    writer.flush()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract the workflows concatenated in a file by run.sh"
+    )
+    parser.add_argument("--wf", dest="workflowfile", type=str, required=True)
+    parser.add_argument(
+        "--dest",
+        dest="destination",
+        type=str,
+        required=True,
+        help="Directory of the records, - to stream them to stdout",
+    )
+    parser.add_argument(
+        "--format", dest="format", choices=list(wfRecords.formats), default="jsonl"
+    )
+    parser.add_argument(
+        "--batch",
+        dest="batch",
+        type=int,
+        default=100,
+        help="Number of workflows whose actions are resolved together",
+    )
+    parser.add_argument(
+        "--yaml-engine",
+        dest="yaml_engine",
+        choices=list(yaml_engines),
+        default=yaml_engine,
+    )
+    scanMetrics.add_arguments(parser)
+
+    args = parser.parse_args()
+    set_yaml_engine(args.yaml_engine)
+    wfRecords.check_format(args.format)
+    # stdout only carries the records, messages are logged to stderr
+    with scanMetrics.start(args):
+        log.info("Starting workflow analysis...")
+        extract_file(args.workflowfile, args.destination, args.batch, args.format)
@@ -0,0 +1,126 @@
+import os
+import re
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+import scanMetrics
+
+# Budgets bounding the work spent on one document and on one repository, 0
+# disables a limit. Documents over a limit are quarantined instead of analyzed
+MAX_BYTES = int(os.getenv("GHAST_MAX_BYTES", str(2 * 2**20)))
+# nodes of a document once its aliases are expanded, an alias bomb has billions
+MAX_NODES = int(os.getenv("GHAST_MAX_NODES", "200000"))
+MAX_STEPS = int(os.getenv("GHAST_MAX_STEPS", "2000"))
+DOC_SECONDS = float(os.getenv("GHAST_DOC_SECONDS", "30"))
+REPO_SECONDS = float(os.getenv("GHAST_REPO_SECONDS", "300"))
+
+# an alias as it starts a node, the text of run blocks can match too
+alias_rex = re.compile(r"(?<![^\s\[{,:-])\*[\w-]")
+
+
+class Quarantined(BaseException):
+    # reason names the limit that was hit: bytes, aliases, steps or deadline.
+    # Like KeyboardInterrupt it is not an Exception, so that the except
+    # Exception blocks of the extraction do not swallow an expired deadline
+    def __init__(self, reason, detail=None):
+        super().__init__(f"{reason} limit exceeded: {detail}")
+        self.reason = reason
+        self.detail = detail
+
+
+def expanded_nodes(document, limit=0) -> int:
+    # Counted on the loaded document, where an alias is the same object as its
+    # anchor: every object is sized once, so a bomb costs no more than its text.
+    # Stops past limit
+    sizes = {}
+
+    def size(node):
+        if not isinstance(node, (dict, list)):
+            return 1
+        key = id(node)
+        if key not in sizes:
+            # an alias inside its own anchor counts as one node
+            sizes[key] = 1
+            children = node.values() if isinstance(node, dict) else node
+            total = 1
+            for child in children:
+                total += size(child)
+                if limit and total > limit:
+                    break
+            sizes[key] = total
+        return sizes[key]
+
+    return size(document)
+
+
+def check_document(sample):
+    # Limits checked on the raw text ahead of the parse
+    if MAX_BYTES:
+        size = len(sample.encode("utf-8", "replace"))
+        if size > MAX_BYTES:
+            raise Quarantined("bytes", size)
+
+
+def check_aliases(sample, document):
+    # Limits checked on the loaded document before it is walked
+    if MAX_NODES and alias_rex.search(sample) is not None:
+        nodes = expanded_nodes(document, MAX_NODES)
+        if nodes > MAX_NODES:
+            raise Quarantined("aliases", nodes)
+
+
+def check_steps(count):
+    if MAX_STEPS and count > MAX_STEPS:
+        raise Quarantined("steps", count)
+
+
+class Budget:
+    # Wall clock left to a repository, every document also has its own limit
+    def __init__(self, seconds=None):
+        seconds = REPO_SECONDS if seconds is None else seconds
+        self.end = time.monotonic() + seconds if seconds else None
+
+    def left(self):
+        if self.end is None:
+            return DOC_SECONDS
+        left = self.end - time.monotonic()
+        if left <= 0:
+            raise Quarantined("deadline", "repository budget spent")
+        return min(left, DOC_SECONDS) if DOC_SECONDS else left
+
+
+@contextmanager
+def deadline(seconds):
+    # Interrupts the block with Quarantined once seconds have elapsed. The timer
+    # signal is only delivered to the main thread, elsewhere nothing is enforced.
+    # It fires again every 0.1s, in case a bare except swallowed the first one
+    if (
+        not seconds
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+    active = [True]
+
+    def expired(signum, frame):
+        if active[0]:
+            raise Quarantined("deadline", f"{seconds:g}s")
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds, 0.1)
+    try:
+        yield
+    finally:
+        active[0] = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def record(collection, error, **fields):
+    # One document per quarantined workflow in ghast.quarantine
+    scanMetrics.inc("quarantined", reason=error.reason)
+    doc = dict(fields, reason=error.reason, detail=error.detail, at=time.time())
+    collection.insert_one(doc)
@@ -0,0 +1,294 @@
+import sys
+from enum import Enum
+from typing import Dict, Optional, Tuple
+
+# Compact in-memory model of an extracted workflow. Objects have no __dict__,
+# names, job ids and action references are interned, event types are enum
+# members and run hashes are raw digests; to_dict() gives back the plain dict
+# layout stored in records, caches and reports.
+
+event_rank = {
+    "fork": 3,
+    "issue_comment": 3,
+    "issues": 3,
+    "pull_request_comment": 3,
+    "watch": 3,
+    "pull_request": 2,
+    "pull_request_target": 2,
+    "pull_request_review": 1,
+    "pull_request_review_comment": 1,
+    "push": 1,
+    "release": 1,
+    "workflow_call": 1,
+    "workflow_dispatch": 1,
+    "workflow_run": 1,
+}
+
+TP_UP_TO_DATE = "TP Actions Up-to-date"
+
+
+def intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def result_key(name, path) -> str:
+    # Key of a workflow in the results: BSON only takes string keys, and GitHub
+    # shows a workflow without a name under the path of its file
+    if name is None:
+        return path
+    return name if type(name) is str else str(name)
+
+
+class RankedEvent(Enum):
+    @property
+    def rank(self) -> int:
+        return event_rank[self.value]
+
+
+EventType = RankedEvent("EventType", [(e.upper(), e) for e in event_rank])
+
+
+class Event:
+    __slots__ = ("type", "filters")
+
+    def __init__(self, type: EventType, filters: Optional[Tuple[str, ...]] = None):
+        self.type = type
+        self.filters = filters
+
+    @classmethod
+    def parse(cls, name, filters=None):
+        # unknown events raise ValueError, the workflow is then not extracted
+        if filters is not None:
+            filters = tuple(intern(str(k)) for k in filters)
+        return cls(EventType(name), filters)
+
+    def to_dict(self):
+        out = {"type": self.type.value, "security_rank": self.type.rank}
+        if self.filters is not None:
+            out["filters"] = list(self.filters)
+        return out
+
+
+class Permissions:
+    # declared: a permissions key is present; scope: a shorthand like read-all;
+    # scopes: {scope: access}
+    __slots__ = ("declared", "scope", "scopes")
+
+    def __init__(self, declared=False, scope=None, scopes=None):
+        self.declared = declared
+        self.scope = scope
+        self.scopes = scopes
+
+    @classmethod
+    def parse(cls, value):
+        if value is None:
+            return UNDECLARED
+        if isinstance(value, dict):
+            return cls(
+                True, None, {intern(str(k)): intern(v) for k, v in value.items()}
+            )
+        return cls(True, intern(str(value)), None)
+
+    def __bool__(self):
+        # the permissions key is set to something granting or revoking access
+        return bool(self.scope or self.scopes)
+
+    def to_dict(self):
+        if not self.declared:
+            return None
+        if self.scopes is not None:
+            return dict(self.scopes)
+        return self.scope
+
+
+UNDECLARED = Permissions()
+
+
+class RunHit:
+    __slots__ = ("position", "line", "conditional", "matches")
+
+    def __init__(self, position, line, conditional, matches=None):
+        self.position = position
+        self.line = line
+        self.conditional = conditional
+        self.matches = matches
+
+    @classmethod
+    def from_dict(cls, d):
+        # hits extracted before runMatcher carry no matches
+        matches = d.get("matches")
+        if matches is not None:
+            matches = tuple((intern(name), col) for name, col in matches)
+        return cls(d["position"], d["line"], d["conditional"], matches)
+
+    def to_dict(self):
+        out = {
+            "position": self.position,
+            "line": self.line,
+            "conditional": self.conditional,
+        }
+        if self.matches is not None:
+            out["matches"] = [list(m) for m in self.matches]
+        return out
+
+
+class Step:
+    # runs is None for steps without a run block; up_to_date is only known for
+    # uses steps and None when the version could not be judged
+    __slots__ = (
+        "name",
+        "conditional",
+        "position",
+        "uses",
+        "lines",
+        "run_hash",
+        "up_to_date",
+        "runs",
+    )
+
+    def __init__(
+        self,
+        name,
+        conditional,
+        position,
+        uses=None,
+        lines=0,
+        run_hash=None,
+        up_to_date=None,
+        runs=None,
+    ):
+        self.name = intern(name)
+        self.conditional = intern(conditional)
+        self.position = position
+        self.uses = intern(uses)
+        self.lines = lines
+        self.run_hash = run_hash
+        self.up_to_date = up_to_date
+        self.runs = runs
+
+    @property
+    def security(self) -> Dict:
+        if self.runs is not None:
+            return {"runs": [hit.to_dict() for hit in self.runs]}
+        if self.uses:
+            return {TP_UP_TO_DATE: self.up_to_date}
+        return {}
+
+    @classmethod
+    def from_dict(cls, d):
+        security = d.get("security") or {}
+        runs = security.get("runs")
+        if runs is not None:
+            runs = tuple(RunHit.from_dict(hit) for hit in runs)
+        run_hash = d.get("run_hash")
+        return cls(
+            d.get("name"),
+            d.get("conditional"),
+            d.get("position"),
+            d.get("uses"),
+            d.get("run", 0),
+            bytes.fromhex(run_hash) if run_hash else None,
+            security.get(TP_UP_TO_DATE),
+            runs,
+        )
+
+    def to_dict(self):
+        out = {
+            "name": self.name,
+            "conditional": self.conditional,
+            "position": self.position,
+            "uses": self.uses,
+            "security": self.security,
+            "run": self.lines,
+        }
+        if self.run_hash is not None:
+            out["run_hash"] = self.run_hash.hex()
+        return out
+
+
+class Job:
+    __slots__ = ("name", "uses", "conditional", "permissions", "steps")
+
+    def __init__(self, name, uses, conditional, permissions, steps):
+        self.name = intern(name)
+        self.uses = intern(uses)
+        self.conditional = intern(conditional)
+        self.permissions = permissions
+        self.steps = steps
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d.get("name"),
+            d.get("uses"),
+            d.get("conditional"),
+            Permissions.parse(d.get("permissions")),
+            tuple(Step.from_dict(s) for s in d.get("steps", [])),
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "uses": self.uses,
+            "conditional": self.conditional,
+            "permissions": self.permissions.to_dict(),
+            "steps": [s.to_dict() for s in self.steps],
+        }
+
+
+class Workflow:
+    # single_event: "on" was a plain string, exported as one event instead of a list
+    __slots__ = (
+        "name",
+        "permissions",
+        "conditional",
+        "events",
+        "single_event",
+        "jobs",
+    )
+
+    def __init__(self, name, permissions, conditional, events, single_event, jobs):
+        self.name = intern(name)
+        self.permissions = permissions
+        self.conditional = intern(conditional)
+        self.events = events
+        self.single_event = single_event
+        self.jobs = jobs
+
+    @property
+    def last_event(self) -> Optional[Event]:
+        return self.events[-1] if self.events else None
+
+    @classmethod
+    def from_dict(cls, d):
+        permissions = d.get("permissions")
+        if permissions == "None":
+            # records written before the model kept repr() of the permissions
+            permissions = None
+        events = d.get("events")
+        single = isinstance(events, dict)
+        if single:
+            events = [events]
+        return cls(
+            d.get("name"),
+            Permissions.parse(permissions),
+            d.get("conditional"),
+            tuple(Event.parse(e["type"], e.get("filters")) for e in events or []),
+            single,
+            {intern(k): Job.from_dict(j) for k, j in d["jobs"].items()},
+        )
+
+    def to_dict(self):
+        events = [e.to_dict() for e in self.events]
+        return {
+            "name": self.name,
+            "permissions": self.permissions.to_dict(),
+            "conditional": self.conditional,
+            "events": events[0] if self.single_event else events,
+            "jobs": {k: j.to_dict() for k, j in self.jobs.items()},
+        }
+
+
+def as_workflow(wf) -> Workflow:
+    # Accepts the plain dicts of records and caches as well
+    return wf if isinstance(wf, Workflow) else Workflow.from_dict(wf)
@@ -0,0 +1,105 @@
+import json
+import os
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# One record per extracted workflow: {"repo": name, "workflow": dict}
+formats = {"jsonl": ".jsonl", "msgpack": ".msgpack"}
+
+length_prefix = struct.Struct(">I")
+
+
+def guess_format(path):
+    if path.endswith(formats["msgpack"]):
+        return "msgpack"
+    return "jsonl"
+
+
+def check_format(fmt):
+    if fmt not in formats:
+        raise ValueError(f"Unknown record format {fmt}, use one of {list(formats)}")
+    if fmt == "msgpack" and msgpack is None:
+        raise ValueError("The msgpack format needs the msgpack package installed")
+
+
+def encode(record, fmt):
+    if fmt == "msgpack":
+        payload = msgpack.packb(record, default=str)
+        return length_prefix.pack(len(payload)) + payload
+    return json.dumps(record, default=str).encode("utf-8") + b"\n"
+
+
+def decode_stream(f, fmt):
+    # Works on pipes too, every record is yielded as soon as it is complete
+    if fmt == "msgpack":
+        while True:
+            head = f.read(length_prefix.size)
+            if len(head) < length_prefix.size:
+                return
+            (size,) = length_prefix.unpack(head)
+            yield msgpack.unpackb(f.read(size), strict_map_key=False)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RecordWriter:
+    # Appends records to a binary stream, and writes a sidecar index
+    # {repo: [offsets]} next to regular files when closed
+    def __init__(self, path, fmt="jsonl", stream=None):
+        check_format(fmt)
+        self.path = path
+        self.fmt = fmt
+        self.stream = stream or open(path, "wb")
+        self.owned = stream is None
+        self.offset = 0
+        self.index = {}
+
+    def write(self, repo, workflow):
+        data = encode({"repo": repo, "workflow": workflow}, self.fmt)
+        self.index.setdefault(repo, []).append(self.offset)
+        self.stream.write(data)
+        self.offset += len(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+        if self.owned:
+            self.stream.close()
+            with open(self.path + ".idx", "w") as f:
+                json.dump(self.index, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_records(path, fmt=None):
+    fmt = fmt or guess_format(path)
+    check_format(fmt)
+    with open(path, "rb") as f:
+        yield from decode_stream(f, fmt)
+
+
+def read_repo(path, repo, fmt=None):
+    # Seeks straight to the records of a single repository through the index
+    fmt = fmt or guess_format(path)
+    check_format(fmt)
+    if not os.path.exists(path + ".idx"):
+        yield from (r for r in read_records(path, fmt) if r["repo"] == repo)
+        return
+    with open(path + ".idx") as f:
+        offsets = json.load(f).get(repo, [])
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield next(decode_stream(f, fmt))
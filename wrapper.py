@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
 from pymongo.mongo_client import MongoClient
+from pymongo import InsertOne, ReplaceOne
 from dotenv import load_dotenv
 from os import getenv
 import argparse
+import logging
 import re
 import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from multiprocessing import Pool
+import bson
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError
 from requests import get
 
 load_dotenv()
@@ -17,153 +28,598 @@ db = client["git-reactions"]["workflows"]
 results = local["ghast"]["results"]
 ghast_chace = local["ghast"]["cache"]
 tags_chace = local["ghast"]["tags_chace"]
+checkpoints = local["ghast"]["checkpoints"]
+quarantine = local["ghast"]["quarantine"]
 
 TOKEN = getenv("ght")
 
+import actionGraph
+import ghClient
+import scanMetrics
 import wfAnalyzer
 import wfExtractor
+import wfLimits
+from wfModel import Workflow, result_key
+
+graph = actionGraph.GraphStore(
+    local["ghast"]["action_nodes"], local["ghast"]["action_edges"]
+)
+
+log = logging.getLogger("wrapper")
 
 
 def debug(message):
-    print(message)
+    log.debug(message)
+
+
+def analyze_workflow(wf, repo, plan=None):
+    return wfAnalyzer.analyze_workflow(wf, repo, label="value", plan=plan)
 
 
 def analyze(dictwf, wfID, repo):
-    commit_rex = r"[0-9a-f]{40}"
     vulns = {}
     for wf_file in dictwf:
         vulns.update({wf_file: {}})
         for wf in dictwf.get(wf_file):
-            # print(wf)
-            _runs = wfAnalyzer.getRuns(wf)
-            _uses = wfAnalyzer.getOOD(wf)
-            _perms = wfAnalyzer.getPerms(wf)
-            if isinstance(wf.get("events"), dict):
-                vulns[wf_file].update(
-                    {
-                        wf.get("name"): {
-                            "events": (
-                                wf.get("events").get("type"),
-                                wf.get("events").get("security_rank"),
-                            ),
-                            "issues": [],
-                        }
-                    }
-                )
-            else:
-                for e in wf.get("events"):
-                    vulns[wf_file].update(
-                        {
-                            wf.get("name"): {
-                                "events": (e.get("type"), e.get("security_rank")),
-                                "issues": [],
-                            }
-                        }
-                    )
-
-            if _runs != []:
-                if _runs:
-                    vulns[wf_file][wf.get("name")]["issues"].append(
-                        (
-                            [
-                                i.name
-                                for i in wfAnalyzer.critical_gh_context
-                                if i.value in "".join(_runs[0][0]["line"])
-                            ],
-                            "".join(_runs[0][0]["line"]),
-                        )
-                    )
-                    vulns[wf_file][wf.get("name")]["issues"].append(
-                        (
-                            [
-                                i.name
-                                for i in wfAnalyzer.critical_secrets
-                                if i.value in "".join(_runs[0][0]["line"])
-                            ],
-                            "".join(_runs[0][0]["line"]),
-                        )
-                    )
-
-            if len(_perms) > 0:
-                wf_perms = False
-                if _perms.get("wf") != "None":
-                    wf_perms = True
-                for job_name, job_p in _perms.get("jobs").items():
-                    if not job_p and wf_perms:
-                        vulns[wf_file][wf.get("name")]["issues"].append(
-                            (
-                                job_name,
-                                wfAnalyzer.critical_permissions.ONLY_WF_DECLARATION.value,
-                            )
-                        )
-                    elif not job_p and not wf_perms:
-                        vulns[wf_file][wf.get("name")]["issues"].append(
-                            (
-                                job_name,
-                                wfAnalyzer.critical_permissions.NO_DECLARATION.value,
-                            )
-                        )
-
-            tags = wfExtractor.get_tags(repo)
-            if len(_uses) > 0:
-                for ood in _uses:
-                    if re.match(ood[1].split("@")[-1], commit_rex):
-                        if not (
-                            ood[1].split("@")[-1] == tags[0].get("commit").get("sha")
-                        ):
-                            print("CASE")
-                            vulns[wf_file][wf.get("name")]["issues"].append(
-                                (ood[0], wfAnalyzer.critical_tp_workflow.WF_OOD.value)
-                            )
-                    elif not ood[2] and not re.match(ood[1].split("@")[-1], commit_rex):
-                        vulns[wf_file][wf.get("name")]["issues"].append(
-                            (ood[0], wfAnalyzer.critical_tp_workflow.WF_OOD.value)
-                        )
-                        vulns[wf_file][wf.get("name")]["issues"].append(
-                            (ood[0], wfAnalyzer.critical_tp_workflow.NO_PINNING.value)
-                        )
-                    elif not ood[2] and re.match(ood[1].split("@")[-1], commit_rex):
-                        vulns[wf_file][wf.get("name")]["issues"].append(
-                            (ood[0], wfAnalyzer.critical_tp_workflow.WF_OOD.value)
-                        )
-                    elif not re.match(ood[1].split("@")[-1], commit_rex):
-                        vulns[wf_file][wf.get("name")]["issues"].append(
-                            (ood[0], wfAnalyzer.critical_tp_workflow.NO_PINNING.value)
-                        )
-    with MongoClient() as client:
-        client["ghast"]["result"].insert_one({"wfID": wfID, "vulns": vulns})
+            name = result_key(wf.get("name"), wf_file)
+            vulns[wf_file][name] = analyze_workflow(wf, repo)
     return vulns
 
 
+class ResultWriter:
+    # upsert replaces the previous result of a repository instead of adding one;
+    # the writes buffered by the sinks are flushed along with the results
+    def __init__(self, collection, batch=100, upsert=False, sinks=()):
+        self.collection = collection
+        self.batch = batch
+        self.upsert = upsert
+        self.sinks = sinks
+        self.buffer = []
+
+    def add(self, wfID, vulns, fingerprint=None):
+        doc = {
+            "wfID": wfID,
+            "vulns": vulns,
+            "fingerprint": fingerprint,
+            "analyzed_at": time.time(),
+        }
+        if self.upsert:
+            self.buffer.append((doc, ReplaceOne({"wfID": wfID}, doc, upsert=True)))
+        else:
+            self.buffer.append((doc, InsertOne(doc)))
+        if len(self.buffer) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            with scanMetrics.timer("db_write"):
+                write_valid(self.collection, self.buffer, "wfID", "invalid_results")
+            self.buffer = []
+        for sink in self.sinks:
+            sink.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def write_valid(collection, pending, key, counter):
+    # pending: [(document, write request)]. A document BSON can not encode fails
+    # the whole bulk, it is dropped alone and counted, and the rest of the batch
+    # written again
+    try:
+        collection.bulk_write([request for _, request in pending], ordered=False)
+        return
+    except InvalidDocument:
+        pass
+    valid = []
+    for doc, request in pending:
+        try:
+            bson.encode(doc)
+        except InvalidDocument as e:
+            log.warning("%s can not be stored: %s", doc[key], e)
+            scanMetrics.inc(counter)
+            continue
+        valid.append(request)
+    if not valid:
+        return
+    try:
+        collection.bulk_write(valid, ordered=False)
+    except BulkWriteError as e:
+        # inserts of a batch sent before the failing one already went through
+        if any(error.get("code") != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+def result_writer(batch, upsert=False):
+    # results are written along with the workflow cache and the dependency
+    # graph they were computed into
+    return ResultWriter(results, batch, upsert, sinks=(wf_cache, graph))
+
+
+def load_analyzed(query=None):
+    # One projection query instead of a find_one round trip per document
+    return {
+        item["wfID"]
+        for item in results.find(query or {}, {"wfID": 1, "_id": 0})
+        if "wfID" in item
+    }
+
+
+def fingerprint(workflow):
+    # Changes whenever a workflow of the repository or the analyzer changes
+    digest = sha256(wfAnalyzer.ANALYZER_VERSION.encode())
+    for item in sorted(workflow.get("workflows"), key=lambda i: (i["name"], i["yaml"])):
+        for part in (item["name"], item["yaml"]):
+            digest.update(b"\0" + part.encode("utf-8", "replace"))
+    return digest.hexdigest()
+
+
+def load_fingerprints(query=None):
+    # Results stored before fingerprints existed map to None, so they are
+    # re-analyzed once by the first incremental run
+    return {
+        item["wfID"]: item.get("fingerprint")
+        for item in results.find(query or {}, {"wfID": 1, "fingerprint": 1, "_id": 0})
+        if "wfID" in item
+    }
+
+
+# Fields of git-reactions.workflows the analysis reads
+SOURCE_FIELDS = {"_id": 1, "name": 1, "workflows.name": 1, "workflows.yaml": 1}
+
+
+def read_source(query, sort=None, limit=0, batch_size=100, fields=()):
+    # Runs can outlive the idle timeout of the server cursor, so it is kept
+    # alive and closed explicitly instead
+    projection = dict(SOURCE_FIELDS, **{field: 1 for field in fields})
+    cursor = db.find(query, projection, no_cursor_timeout=True, batch_size=batch_size)
+    if sort is not None:
+        cursor = cursor.sort(sort, 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+class Pipeline:
+    # Iterates a source in a reader thread at most `depth` items ahead of the
+    # consumer, so cursor fetches and action prefetches overlap with analysis
+    # while memory stays bounded; the time each side waited is reported
+    done = object()
+
+    def __init__(self, source, depth, name="source"):
+        self.queue = queue.Queue(maxsize=depth)
+        self.name = name
+        self.stopped = threading.Event()
+        self.error = None
+        self.reader_blocked = 0.0
+        self.consumer_blocked = 0.0
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.read, args=(source,), daemon=True)
+        self.thread.start()
+
+    def read(self, source):
+        try:
+            for item in source:
+                if not self.put(item):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            # a generator source closes its cursor when closed
+            getattr(source, "close", lambda: None)()
+            self.put(self.done)
+
+    def put(self, item):
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.reader_blocked += time.perf_counter() - start
+        return not self.stopped.is_set()
+
+    def __iter__(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self.queue.get()
+                self.consumer_blocked += time.perf_counter() - start
+                if item is self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        wall = time.perf_counter() - self.started
+        scanMetrics.inc("pipeline_blocked_seconds", self.reader_blocked, side="reader")
+        scanMetrics.inc(
+            "pipeline_blocked_seconds", self.consumer_blocked, side="analysis"
+        )
+        log.info(
+            "Pipeline of %s: reader blocked %.1fs on a full queue, analysis blocked "
+            "%.1fs on an empty one, out of %.1fs",
+            self.name,
+            self.reader_blocked,
+            self.consumer_blocked,
+            wall,
+        )
+
+
+def prefetched(cursor, skip, size):
+    # Warm the action cache for a whole batch of documents before extracting it
+    batch = []
+    for workflow in cursor:
+        batch.append(workflow)
+        if len(batch) >= size:
+            yield from warm(batch, skip)
+            batch = []
+    yield from warm(batch, skip)
+
+
+def warm(batch, skip):
+    wfExtractor.prefetch_actions(
+        item["yaml"]
+        for workflow in batch
+        if workflow.get("_id") not in skip
+        for item in workflow.get("workflows")
+    )
+    return batch
+
+
+class WorkflowCache:
+    # Extraction and analysis of a workflow keyed by the hash of its YAML and
+    # the analyzer version, none of them depends on the repository; the memory
+    # tier holds Workflow objects, the collection their dict export
+    def __init__(self, collection, ttl, size=4096):
+        self.collection = collection
+        self.ttl = ttl
+        self.size = size
+        self.memory = OrderedDict()
+        self.pending = []
+
+    @staticmethod
+    def key(sample):
+        return sha256(
+            f"{wfAnalyzer.ANALYZER_VERSION}\n{sample}".encode("utf-8", "replace")
+        ).hexdigest()
+
+    def remember(self, key, item):
+        self.memory[key] = item
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def recall(self, key):
+        # Entry of the memory tier, expired like those of the collection
+        item = self.memory.get(key)
+        if item is not None and item["cached_at"] <= time.time() - self.ttl:
+            del self.memory[key]
+            return None
+        return item
+
+    def lookup(self, keys):
+        found = {}
+        for k in keys:
+            item = self.recall(k)
+            if item is not None:
+                found[k] = item
+        scanMetrics.inc("cache_hits", len(found), tier="workflows_memory")
+        missing = list({k for k in keys if k not in found})
+        if missing:
+            fresh = time.time() - self.ttl
+            hits = 0
+            for item in self.collection.find(
+                {"_id": {"$in": missing}, "cached_at": {"$gt": fresh}}
+            ):
+                if item["wf"] is not None:
+                    item["wf"] = Workflow.from_dict(item["wf"])
+                found[item["_id"]] = item
+                self.remember(item["_id"], item)
+                hits += 1
+            scanMetrics.inc("cache_hits", hits, tier="workflows_mongo")
+            scanMetrics.inc("cache_misses", len(missing) - hits, tier="workflows_mongo")
+        return found
+
+    def put(self, key, wf, entry):
+        # Only buffered, the write waits for flush() outside of the deadline of
+        # the document
+        item = {"_id": key, "wf": wf, "entry": entry, "cached_at": time.time()}
+        self.remember(key, item)
+        self.pending.append(item)
+
+    def flush(self):
+        if self.pending:
+            pending = []
+            for item in self.pending:
+                doc = dict(item, wf=item["wf"] and item["wf"].to_dict())
+                pending.append((doc, ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)))
+            with scanMetrics.timer("cache_write"):
+                write_valid(self.collection, pending, "_id", "invalid_cache_entries")
+            self.pending = []
+
+
+# verdicts on action versions inside cached extractions expire with the action index
+wf_cache = WorkflowCache(local["ghast"]["wf_cache"], wfExtractor.ACTIONS_TTL)
+
+
+def process_workflow(workflow):
+    # (results, complete) of a repository, complete is False when a workflow
+    # ran out of time and was left out
+    _repo_name = workflow.get("name")
+    items = workflow.get("workflows")
+    keys = [wf_cache.key(item["yaml"]) for item in items]
+    cached = wf_cache.lookup(keys)
+    budget = wfLimits.Budget()
+    vulns = {}
+    extracted = []
+    complete = True
+    for item, key in zip(items, keys):
+        # identical workflows inside the same repository are only extracted once
+        hit = cached.get(key) or wf_cache.recall(key)
+        try:
+            with wfLimits.deadline(budget.left()):
+                entry = process_item(item, key, hit, _repo_name)
+        except wfLimits.Quarantined as e:
+            log.warning("Quarantined %s of %s: %s", item["name"], _repo_name, e)
+            wfLimits.record(
+                quarantine,
+                e,
+                wfID=workflow.get("_id"),
+                repo=_repo_name,
+                workflow=item["name"],
+                key=key,
+            )
+            if e.reason == "deadline":
+                complete = False
+            continue
+        if entry is not None:
+            wf, entry = entry
+            extracted.append((item["name"], wf))
+            name = result_key(wf.name, item["name"])
+            vulns.setdefault(item["name"], {})[name] = entry
+    graph.record(_repo_name, workflow.get("_id"), extracted)
+    return vulns, complete
+
+
+def analyze_repository(workflow):
+    # (results, fingerprint) of a repository; a workflow out of time may fit on
+    # a retry, so without a fingerprint the next incremental run analyzes it again
+    vulns, complete = process_workflow(workflow)
+    return vulns, fingerprint(workflow) if complete else None
+
+
+def process_item(item, key, hit, repo):
+    # (workflow, analysis) of a source workflow, None when it is not one
+    plan = None
+    if hit is None:
+        plan = wfExtractor.classify(item["yaml"])
+        wf = wfExtractor.extract_workflow(item["yaml"], plan)
+        entry = None
+    else:
+        wf, entry = hit["wf"], hit["entry"]
+    if wf is None:
+        if hit is None:
+            wf_cache.put(key, wf, None)
+        return None
+    if entry is None:
+        entry = analyze_workflow(wf, repo, plan)
+        if hit is None:
+            wf_cache.put(key, wf, entry)
+    return wf, entry
+
+
+def init_worker(yaml_engine, log_level):
+    # MongoClient instances are not fork-safe, every worker opens its own
+    wfExtractor.set_yaml_engine(yaml_engine)
+    logging.basicConfig(level=log_level, format=scanMetrics.LOG_FORMAT)
+    global client, local, db, results, checkpoints, quarantine, graph, wf_cache
+    client = MongoClient(getenv("srcDB"))
+    local = MongoClient("localhost")
+    db = client["git-reactions"]["workflows"]
+    results = local["ghast"]["results"]
+    checkpoints = local["ghast"]["checkpoints"]
+    quarantine = local["ghast"]["quarantine"]
+    graph = actionGraph.GraphStore(
+        local["ghast"]["action_nodes"], local["ghast"]["action_edges"]
+    )
+    wf_cache = WorkflowCache(local["ghast"]["wf_cache"], wfExtractor.ACTIONS_TTL)
+
+
+def split_ranges(workers, count):
+    # Boundaries are sampled on the _id index so every range gets ~count/workers docs
+    step = -(-count // workers)
+    bounds = []
+    for i in range(1, workers):
+        doc = next(db.find({}, {"_id": 1}).sort("_id", 1).skip(i * step).limit(1), None)
+        if doc is None:
+            break
+        bounds.append(doc["_id"])
+    edges = [None] + bounds + [None]
+    return [
+        (edges[i], edges[i + 1], min(step, count - i * step))
+        for i in range(len(edges) - 1)
+    ]
+
+
+def range_query(low, high, field="_id"):
+    query = {}
+    if low is not None:
+        query["$gte"] = low
+    if high is not None:
+        query["$lt"] = high
+    return {field: query} if query else {}
+
+
+def run_range(task):
+    low, high, quota, every, batch, depth, cursor_batch = task
+    # a worker can run several ranges, each returns only its own metrics
+    scanMetrics.reset()
+    key = f"{low}:{high}:{quota}"
+    state = checkpoints.find_one({"_id": key}) or {"last": None, "done": 0}
+    if state.get("finished") or state["done"] >= quota:
+        return key, state["done"], 0, ghClient.stats(), scanMetrics.snapshot()
+    query = range_query(low, high)
+    if state["last"] is not None:
+        query.setdefault("_id", {})["$gt"] = state["last"]
+    done = state["done"]
+    analyzed = 0
+    last = state["last"]
+    skip = load_analyzed(range_query(low, high, "wfID"))
+    with result_writer(batch) as writer:
+        cursor = read_source(query, "_id", quota - done, cursor_batch)
+        for workflow in Pipeline(prefetched(cursor, skip, batch), depth, key):
+            if workflow.get("_id") not in skip:
+                writer.add(workflow.get("_id"), *analyze_repository(workflow))
+                analyzed += 1
+            last = workflow.get("_id")
+            done += 1
+            if done % every == 0:
+                # results must be stored before the checkpoint moves past them
+                writer.flush()
+                checkpoints.update_one(
+                    {"_id": key}, {"$set": {"last": last, "done": done}}, upsert=True
+                )
+    checkpoints.update_one(
+        {"_id": key},
+        {"$set": {"last": last, "done": done, "finished": True}},
+        upsert=True,
+    )
+    return key, done, analyzed, ghClient.stats(), scanMetrics.snapshot()
+
+
+def main_parallel(argv, count):
+    ranges = split_ranges(argv.workers, count)
+    log.info("Splitting %d workflows in %d ranges...", count, len(ranges))
+    tasks = [
+        (low, high, quota, argv.checkpoint, argv.batch, argv.queue, argv.cursor_batch)
+        for low, high, quota in ranges
+    ]
+    with Pool(
+        argv.workers,
+        initializer=init_worker,
+        initargs=(argv.yaml_engine, argv.log_level),
+    ) as pool:
+        for key, done, analyzed, api, snap in pool.imap_unordered(run_range, tasks):
+            # the exported metrics of the parent are the sum of the finished ranges
+            scanMetrics.merge(snap)
+            log.info("Range %s completed: %d visited, %d analyzed", key, done, analyzed)
+            log.info("GitHub API usage of range %s: %s", key, api)
+
+
+def changed(cursor, known, state, field):
+    # Yields the documents whose fingerprint differs from the stored result,
+    # the watermark follows the documents visited
+    for workflow in cursor:
+        if known.get(workflow.get("_id")) != fingerprint(workflow):
+            yield workflow
+        state["visited"] += 1
+        if field is not None and workflow.get(field) is not None:
+            state["watermark"] = workflow.get(field)
+
+
+def main_incremental(argv):
+    # With --updated-field only the documents modified after the last run are
+    # read, otherwise every document is fingerprinted but only changes analyzed
+    field = argv.updated_field
+    key = "incremental" if field is None else f"incremental:{field}"
+    saved = checkpoints.find_one({"_id": key}) or {}
+    query = {}
+    if field is not None and saved.get("watermark") is not None:
+        # documents sharing the watermark value are fingerprinted again, not skipped
+        query = {field: {"$gte": saved["watermark"]}}
+    known = load_fingerprints()
+    log.info("%d repositories analyzed so far, looking for changes...", len(known))
+    state = {"visited": 0, "watermark": saved.get("watermark")}
+    analyzed = 0
+    cursor = read_source(
+        query, field or "_id", 0, argv.cursor_batch, [field] if field else []
+    )
+    # fingerprints and action prefetches are computed by the reader thread
+    source = prefetched(changed(cursor, known, state, field), set(), argv.batch)
+    with result_writer(argv.batch, upsert=True) as writer:
+        for workflow in Pipeline(source, argv.queue, key):
+            writer.add(workflow.get("_id"), *analyze_repository(workflow))
+            analyzed += 1
+            if field is not None and analyzed % argv.checkpoint == 0:
+                # results must be stored before the watermark moves past them, a
+                # batch is read ahead so the last analyzed document bounds it
+                writer.flush()
+                checkpoints.update_one(
+                    {"_id": key},
+                    {"$set": {"watermark": workflow.get(field)}},
+                    upsert=True,
+                )
+    checkpoints.update_one(
+        {"_id": key},
+        {"$set": {"watermark": state["watermark"], "finished_at": time.time()}},
+        upsert=True,
+    )
+    log.info("%d repositories visited, %d re-analyzed", state["visited"], analyzed)
+    log.info("GitHub API usage: %s", ghClient.stats())
+
+
+def main_watch(argv):
+    # Follows the change stream of the source collection (replica sets only),
+    # the resume token is saved after every change so a restart misses nothing
+    saved = checkpoints.find_one({"_id": "watch"}) or {}
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+    log.info("Watching %s for changes...", db.full_name)
+    with db.watch(
+        pipeline, full_document="updateLookup", resume_after=saved.get("token")
+    ) as stream, result_writer(1, upsert=True) as writer:
+        for change in stream:
+            workflow = change.get("fullDocument")
+            if workflow is not None:
+                stored = results.find_one(
+                    {"wfID": workflow.get("_id")}, {"fingerprint": 1, "_id": 0}
+                )
+                current = fingerprint(workflow)
+                if (stored or {}).get("fingerprint") != current:
+                    log.debug("Re-analyzing %s", workflow.get("name"))
+                    writer.add(workflow.get("_id"), *analyze_repository(workflow))
+            checkpoints.update_one(
+                {"_id": "watch"}, {"$set": {"token": stream.resume_token}}, upsert=True
+            )
+
+
 def main(argv):
+    results.create_index("wfID")
+    if argv.watch:
+        return main_watch(argv)
+    if argv.incremental:
+        return main_incremental(argv)
     count = 0
     if argv.count == 0:
         count = db.count_documents({})
     else:
         count = argv.count
-    print(f"Collecting {count} workflows...")
-    for workflow in db.find({}).limit(count):
-        if not results.find_one({"wfID": workflow.get("_id")}):
-            # print(f"Processing {workflow.get('name', 'NONAME')}...")
-            _id = workflow.get("_id")
-            _repo_name = workflow.get("name")
-            processed = dict()
-            _wf_list = []
-            for item in workflow.get("workflows"):
-
-                _wf_list.append(
-                    (item["name"], wfExtractor.extract_workflow(item["yaml"]))
-                )
-            for name, item in _wf_list:
-                # print(name, item)
-                if "jobs" not in item.keys():
-                    continue
-                if name not in processed.keys():
-                    processed.update({name: []})
-                processed[name].append(item)
-            analyze(processed, _id, _repo_name)
-        else:
-            print("Already analyzed")
+    if argv.workers > 1:
+        return main_parallel(argv, count)
+    log.info("Collecting %d workflows...", count)
+    skip = load_analyzed()
+    log.info("%d workflows already analyzed", len(skip))
+    cursor = read_source({}, None, count, argv.cursor_batch)
+    source = prefetched(cursor, skip, argv.batch)
+    with result_writer(argv.batch) as writer:
+        for workflow in Pipeline(source, argv.queue):
+            if workflow.get("_id") not in skip:
+                # print(f"Processing {workflow.get('name', 'NONAME')}...")
+                writer.add(workflow.get("_id"), *analyze_repository(workflow))
+    log.info("GitHub API usage: %s", ghClient.stats())
 
 
 if __name__ == "__main__":
@@ -177,7 +633,69 @@ if __name__ == "__main__":
         default=1000,
         help="Number of workflows to analyze (0 for all)",
     )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of processes analyzing disjoint _id ranges of the collection",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        dest="checkpoint",
+        type=int,
+        default=50,
+        help="Save the progress of a range every N workflows (resumed on restart)",
+    )
+    parser.add_argument(
+        "--batch",
+        dest="batch",
+        type=int,
+        default=100,
+        help="Number of results buffered before a bulk write to ghast.results",
+    )
+    parser.add_argument(
+        "--cursor-batch",
+        dest="cursor_batch",
+        type=int,
+        default=50,
+        help="Number of source documents returned by each round trip of the cursor",
+    )
+    parser.add_argument(
+        "--queue",
+        dest="queue",
+        type=int,
+        default=200,
+        help="Number of source documents read ahead of the analysis",
+    )
+    parser.add_argument(
+        "--yaml-engine",
+        dest="yaml_engine",
+        choices=list(wfExtractor.yaml_engines),
+        default=wfExtractor.yaml_engine,
+        help="YAML loader used to parse workflows (roundtrip is the pure Python fallback)",
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="Only re-analyze repositories whose workflows changed since their result",
+    )
+    parser.add_argument(
+        "--updated-field",
+        dest="updated_field",
+        help="Last modification field of the source documents, used as watermark by --incremental",
+    )
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Keep re-analyzing repositories as they change (needs a replica set)",
+    )
+    scanMetrics.add_arguments(parser)
 
     args = parser.parse_args()
-    debug(f"running with {args}, srcDB is {getenv('srcDB')}")
-    main(args)
+    wfExtractor.set_yaml_engine(args.yaml_engine)
+    with scanMetrics.start(args):
+        debug(f"running with {args}, srcDB is {getenv('srcDB')}")
+        main(args)